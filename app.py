@@ -1,12 +1,25 @@
 import streamlit as st
 import requests
-import pandas as pd
-import time
+import os
+import uuid
+from datetime import datetime
+
+from data_grid import column_profile, show_data_grid
+from export import FORMATS, show_exports, start_export
+from fetch_engine import FetchCancelled, check_cancelled, datatables_page, datatables_total, fetch_datatables, new_progress
+from http_client import get_client
+from ingest import PageSink, iter_ingested
+from jobs import format_eta, get_job_manager
+from page_size_tuner import PageSizeTuner
+from query_engine import QueryEngine
+from sharding import fetch_sharded
+from token_manager import TokenManager, extract_token
 
 # --- CONFIG ---
 BASE_URL = "https://bios.kemenkeu.go.id"
 AUTH_URL = BASE_URL + "/api2/authenticate"
 DATA_URL = BASE_URL + "/api/pengajuan/data"
+DATA_DIR = "bios_data"
 
 st.set_page_config(page_title="BIOS Webservice Dashboard", layout="wide")
 st.title("📊 BIOS Webservice Dashboard")
@@ -14,8 +27,19 @@ st.title("📊 BIOS Webservice Dashboard")
 # --- SESSION STATE ---
 if "token" not in st.session_state:
     st.session_state.token = None
-if "data" not in st.session_state:
-    st.session_state.data = None
+if "token_manager" not in st.session_state:
+    st.session_state.token_manager = None
+if "data_path" not in st.session_state:
+    st.session_state.data_path = None
+if "session_id" not in st.session_state:
+    # Job dipakai bersama oleh semua sesi browser; id ini menandai job milik sesi ini
+    st.session_state.session_id = uuid.uuid4().hex
+if "show_data" not in st.session_state:
+    st.session_state.show_data = False
+if "query_engine" not in st.session_state:
+    st.session_state.query_engine = QueryEngine()
+if "export_jobs" not in st.session_state:
+    st.session_state.export_jobs = {}
 
 # --- SIDEBAR STRUCTURE ---
 with st.sidebar:
@@ -34,13 +58,13 @@ with st.sidebar:
                     if res.status_code == 200:
                         data = res.json()
                         # token bisa berada di key 'token', 'data.token', atau 'access_token'
-                        token = (
-                            data.get("token")
-                            or data.get("access_token")
-                            or (data.get("data", {}).get("token") if "data" in data else None)
-                        )
+                        token = extract_token(data)
                         if token:
                             st.session_state.token = token
+                            # Kredensial disimpan agar token bisa diperbarui otomatis saat kadaluarsa
+                            st.session_state.token_manager = TokenManager(
+                                token, auth_url=AUTH_URL, username=username, password=password
+                            )
                             st.success("✅ Login berhasil!")
                         else:
                             st.error("Login berhasil tapi token tidak ditemukan.")
@@ -55,6 +79,10 @@ with st.sidebar:
     st.header("⏱️ 2️⃣ Extra Miles")
     from_date = st.text_input("Tanggal Awal (YYYY/MM/DD)")
     to_date = st.text_input("Tanggal Akhir (YYYY/MM/DD)")
+    shard_options = {"Tidak dipecah": None, "Per hari": "day", "Per minggu": "week", "Per bulan": "month"}
+    shard_label = st.selectbox("Pecah rentang tanggal", list(shard_options),
+                               help="Setiap potongan tanggal diambil paralel dengan paginasi yang dangkal")
+    shard_workers = st.number_input("Potongan diambil bersamaan", min_value=1, max_value=16, value=4)
     fetch_btn = st.button("📡 Ambil Data")
 
     st.divider()
@@ -68,79 +96,145 @@ if fetch_btn:
     elif not from_date or not to_date:
         st.error("Harap isi tanggal awal dan akhir.")
     else:
-        with st.spinner("Mengambil data dari BIOS..."):
-            session = requests.Session()
-            session.headers.update({
-                "Authorization": f"Bearer {st.session_state.token}",
-                "Accept": "application/json, text/javascript, */*; q=0.01",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
-                "X-Requested-With": "XMLHttpRequest"
-            })
-
-            PAGE_SIZE = 1000
-            all_records = []
-            page = 1
-            start = 0
-            while True:
-                params = {
-                    "draw": page,
-                    "start": start,
-                    "length": PAGE_SIZE,
-                    "from_date": from_date,
-                    "to_date": to_date,
-                    "kdsatker": "",
-                    "status": ""
-                }
-                try:
-                    r = session.get(DATA_URL, params=params, timeout=60)
-                except Exception as e:
-                    st.error(f"Request gagal: {e}")
-                    break
-
-                if r.status_code == 401:
-                    st.error("❌ 401 Unauthorized — Token tidak valid atau kadaluarsa.")
-                    break
-
-                if r.status_code != 200:
-                    st.error(f"Server error ({r.status_code})")
-                    st.text(r.text[:500])
-                    break
-
-                js = r.json()
-                records = js.get("data") or js.get("records") or js.get("aaData") or []
-                if not records:
-                    st.info("✅ Tidak ada data tambahan, selesai.")
-                    break
-
-                all_records.extend(records)
-                if len(records) < PAGE_SIZE:
-                    break
-                page += 1
-                start += PAGE_SIZE
-                time.sleep(0.5)
-
-            if all_records:
-                df = pd.DataFrame(all_records)
-                st.session_state.data = df
-                st.success(f"✅ Data berhasil diambil ({len(df)} baris).")
+        token_manager = st.session_state.token_manager or TokenManager(st.session_state.token)
+        headers = {
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+            "X-Requested-With": "XMLHttpRequest"
+        }
+        shard_unit = shard_options[shard_label]
+        range_from, range_to = from_date, to_date
+
+        def run_fetch(job):
+            """Jalan di thread job (tanpa st.*); mengembalikan path file hasil atau None"""
+            # Ukuran halaman disesuaikan otomatis dan diingat per endpoint
+            tuner = PageSizeTuner(DATA_URL)
+            # Setiap halaman langsung ditulis ke disk agar memori tidak membengkak
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            sink = PageSink(os.path.join(DATA_DIR, f"pengajuan_{timestamp}.parquet"))
+            progress = job.progress["pengajuan"] = new_progress()
+            progress["status"] = "fetching"
+
+            def range_params(window_from, window_to):
+                return {"from_date": window_from, "to_date": window_to, "kdsatker": "", "status": ""}
+
+            def fetch_range(window_from, window_to, emit, first_page=None):
+                """Walk the start/length pages of one date range, passing each page's rows to `emit`"""
+                def count_page(records):
+                    progress["pages"] += 1
+                    progress["records"] += len(records)
+                    emit(records)
+
+                fetch_datatables(DATA_URL, range_params(window_from, window_to), count_page, tuner,
+                                 auth=token_manager, headers=headers, cancel=job.cancel_event, first_page=first_page)
+
+            try:
+                if shard_unit is None:
+                    fetch_range(range_from, range_to, sink.write)
+                    failed = []
+                else:
+                    def probe_window(window_start, window_end):
+                        # Halaman pertama memberi jumlah baris potongan; potongan yang padat dibelah dua
+                        check_cancelled(job.cancel_event)
+                        params = range_params(window_start.strftime("%Y/%m/%d"), window_end.strftime("%Y/%m/%d"))
+                        page = datatables_page(DATA_URL, params, tuner, auth=token_manager, headers=headers)
+                        total = datatables_total(page[1])
+                        return (0 if total is None else total), page
+
+                    # Setiap halaman langsung ditulis ke file, potongan tidak ditampung di memori
+                    def fetch_window(window_start, window_end, probe, emit_page):
+                        fetch_range(window_start.strftime("%Y/%m/%d"), window_end.strftime("%Y/%m/%d"),
+                                    emit_page, first_page=probe)
+
+                    _, failed = fetch_sharded(range_from, range_to, fetch_window, sink.write, unit=shard_unit,
+                                              max_workers=shard_workers, probe_window=probe_window)
+                    if job.cancelled:
+                        raise FetchCancelled("Fetch cancelled")
+                    for (window_start, window_end), error in failed:
+                        job.log("error", f"Potongan {window_start} s/d {window_end} gagal: {error}")
+                if failed:
+                    job.log("warning", f"⚠️ {len(failed)} potongan gagal, data belum lengkap.")
+                else:
+                    job.log("info", "✅ Tidak ada data tambahan, selesai.")
+            except BaseException as e:
+                # Tidak ada file setengah jadi (*.partial) yang tertinggal di bios_data/;
+                # job mencatat galatnya dan menampilkannya sebagai "Request gagal"
+                sink.abort()
+                progress["status"] = "cancelled" if isinstance(e, FetchCancelled) else "failed"
+                raise
+            finally:
+                tuner.save()
+            progress["status"] = "done"
+
+            if not sink.rows:
+                sink.abort()
+                job.log("warning", "Tidak ada data yang diambil.")
+                return None
+            if not failed:
+                job.log("success", f"✅ Data berhasil diambil ({sink.rows} baris).")
+            else:
+                job.log("warning", f"⚠️ Data diambil sebagian ({sink.rows} baris).")
+            return sink.close()
+
+        # Pengambilan berjalan di latar belakang: tetap jalan walau halaman di-rerun atau ditinggalkan
+        get_job_manager().submit(f"Pengajuan {from_date} s/d {to_date}", run_fetch, owner=st.session_state.session_id)
+
+
+@st.fragment(run_every=2)
+def show_fetch_jobs():
+    """Progres pengambilan di latar belakang; diperbarui sendiri tanpa me-rerun seluruh halaman"""
+    client = get_client()
+    for job in get_job_manager().jobs(st.session_state.session_id):
+        if job.status == "done" and job.result:
+            # Hasil terbaru langsung siap ditampilkan
+            st.session_state.data_path = job.take_result()
+            if st.session_state.token_manager:
+                st.session_state.token = st.session_state.token_manager.token
+
+        totals = job.totals()
+        with st.container(border=True):
+            st.markdown(f"**{job.name}** — {job.status}")
+            st.caption(f"📄 {totals['records']} baris · {totals['pages']} halaman · "
+                       f"🚀 {job.pages_per_second():.1f} halaman/detik · ⏳ ETA {format_eta(job.eta_seconds())} · "
+                       f"⚡ {client.rate_limiter.rate:.1f} req/s")
+            for level, text in list(job.messages):
+                getattr(st, level)(text)
+            if job.error:
+                st.error(f"Request gagal: {job.error}")
+            if job.finished:
+                st.button("🗑️ Tutup", key=f"dismiss_{job.id}", on_click=get_job_manager().forget, args=(job.id,))
             else:
-                st.warning("Tidak ada data yang diambil.")
+                st.button("⏹️ Batalkan", key=f"cancel_{job.id}", on_click=job.cancel, disabled=job.cancelled)
+
+
+show_fetch_jobs()
+
 
 # --- DISPLAY DATA ---
+# Tetap tampil saat tabel di-sort atau dipindah halaman (setiap klik memicu rerun)
 if show_data_btn:
-    if st.session_state.data is None or st.session_state.data.empty:
+    st.session_state.show_data = True
+if st.session_state.show_data:
+    if not st.session_state.data_path or not os.path.exists(st.session_state.data_path):
         st.warning("Belum ada data yang diambil. Klik 'Ambil Data' di sidebar terlebih dahulu.")
     else:
-        df = st.session_state.data
+        data_path = st.session_state.data_path
+        engine = st.session_state.query_engine
+        # File hasil tidak dimuat utuh; DuckDB hanya membaca halaman yang sedang dilihat
+        engine.register_file("hasil", data_path)
 
         st.subheader("📊 Data Hasil Pengambilan")
-        st.dataframe(df, use_container_width=True, height=500)
-
-        # Tombol download Excel
-        to_excel = df.to_excel(index=False, engine='openpyxl')
-        st.download_button(
-            label="💾 Download sebagai Excel",
-            data=to_excel,
-            file_name="hasil_bios.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        show_data_grid(engine, "hasil", key="hasil", lang="id", height=500)
+        with st.expander("📈 Info Kolom"):
+            st.dataframe(column_profile(engine, "hasil", (data_path, os.path.getmtime(data_path))))
+
+        # Ekspor ditulis bertahap ke file sementara di latar belakang, lalu siap di-download
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            export_format = st.selectbox("Format", list(FORMATS), index=list(FORMATS).index("xlsx"),
+                                         format_func=lambda fmt: FORMATS[fmt][0])
+        with col2:
+            if st.button("📦 Siapkan Download"):
+                job = start_export("hasil_bios", iter_ingested(data_path), export_format, engine.count("hasil"))
+                st.session_state.export_jobs[job.id] = (f"hasil_bios{FORMATS[export_format][1]}", export_format)
+        show_exports(lang="id")
@@ -0,0 +1,147 @@
+"""Headless bulk pulls for scheduled jobs, using the same fetch engine as home.py.
+
+    python batch_runner.py nightly.json
+
+The job file is JSON:
+
+    {
+        "endpoints_file": "keuangan.txt",
+        "date_ranges": [["2024-01-01", "2024-06-30"], ["2024-07-01", "2024-12-31"]],
+        "satkers": ["415670", "415671"],
+        "params": {"status": ""},
+        "output_dir": "datasets",
+        "format": "store"
+    }
+
+`endpoints` may list URLs directly instead of `endpoints_file`, and
+`satkers_file` may replace `satkers`. `format` is "store" (the partitioned
+dataset store in `output_dir`, the default) or "parquet" / "csv" for one
+file per endpoint. The other optional keys match the home.py settings:
+max_pages, concurrency, parallel_endpoints, max_requests, per_host, resume,
+shard, shard_workers and dense_rows. Auth comes from BIOS_TOKEN /
+BIOS_USERNAME / BIOS_PASSWORD in the environment.
+"""
+import argparse
+import json
+import os
+import sys
+
+from dataset_store import STORE_DIR, DatasetStore
+from fetch_engine import EndpointRequest, fetch_endpoint, new_progress
+from ingest import PageSink
+from scheduler import FetchScheduler, read_satkers
+from token_manager import TokenManager
+
+
+def read_endpoints(path):
+    """Endpoint URLs from a file with one per line, like keuangan.txt"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_job(path):
+    with open(path, encoding="utf-8") as f:
+        job = json.load(f)
+
+    endpoints = job.get("endpoints") or []
+    if job.get("endpoints_file"):
+        endpoints += read_endpoints(job["endpoints_file"])
+    if not endpoints:
+        raise ValueError("The job has no endpoints (set 'endpoints' or 'endpoints_file')")
+    job["endpoints"] = list(dict.fromkeys(endpoints))
+
+    if job.get("satkers_file"):
+        job["satkers"] = read_satkers(job["satkers_file"])
+    elif isinstance(job.get("satkers"), str):
+        job["satkers"] = read_satkers(job["satkers"])
+    if job.get("format", "store") not in ("store", "csv", "parquet"):
+        raise ValueError(f"Unknown output format: {job['format']}")
+    return job
+
+
+def endpoint_name(endpoint):
+    return endpoint.rstrip("/").split("/")[-1] or "endpoint"
+
+
+def run_job(job, token=None):
+    """Fetch every (endpoint, date range, satker) unit of `job`; returns (rows per dataset or file, failed units)"""
+    endpoints = job["endpoints"]
+    date_ranges = job.get("date_ranges") or [None]
+    satkers = job.get("satkers") or [None]
+    file_format = job.get("format", "store")
+    output_dir = job.get("output_dir", STORE_DIR if file_format == "store" else "batch_output")
+    store = DatasetStore(output_dir) if file_format == "store" else None
+    shard_unit = job.get("shard")
+
+    token = token or TokenManager.from_env(endpoints[0])
+    scheduler = FetchScheduler(max_endpoints=job.get("parallel_endpoints", 4),
+                               max_requests=job.get("max_requests", 8), per_host=job.get("per_host", 4))
+    os.makedirs(output_dir, exist_ok=True)
+
+    units = [(endpoint, date_range, kdsatker)
+             for endpoint in endpoints for date_range in date_ranges for kdsatker in satkers]
+
+    def run_unit(unit):
+        endpoint, date_range, kdsatker = unit
+        params = dict(job.get("params") or {})
+        if date_range:
+            params["from_date"], params["to_date"] = date_range
+        if kdsatker:
+            params["kdsatker"] = kdsatker
+        request = EndpointRequest(endpoint, params, auth=token, scheduler=scheduler)
+        return fetch_endpoint(
+            request, first_page=0, max_pages=job.get("max_pages"), concurrency=job.get("concurrency", 4),
+            resume=job.get("resume", True), shard_unit=shard_unit if date_range else None,
+            from_date=date_range[0] if date_range else None, to_date=date_range[1] if date_range else None,
+            shard_workers=job.get("shard_workers", 4), dense_threshold=job.get("dense_rows", 5000),
+            progress=new_progress()
+        )
+
+    sinks = {}
+    written = {}
+    failed = []
+    try:
+        # Every endpoint gets one dataset or output file; only this thread writes to it
+        for (endpoint, date_range, kdsatker), result, error in scheduler.run(units, run_unit):
+            label = f"{endpoint_name(endpoint)} {'..'.join(date_range or ['all'])} kdsatker={kdsatker or 'all'}"
+            if error is not None:
+                print(f"FAILED {label}: {error}", file=sys.stderr)
+                failed.append((endpoint, date_range, kdsatker))
+                continue
+
+            records, checkpoints = result
+            if records and kdsatker:
+                records = [{"kdsatker": kdsatker, **row} for row in records]
+            if records and store:
+                store.upsert(endpoint_name(endpoint), records, source=endpoint)
+                written[endpoint_name(endpoint)] = written.get(endpoint_name(endpoint), 0) + len(records)
+            elif records:
+                if endpoint not in sinks:
+                    sinks[endpoint] = PageSink(os.path.join(output_dir, f"{endpoint_name(endpoint)}.{file_format}"))
+                sinks[endpoint].write(records)
+            for checkpoint in checkpoints:
+                checkpoint.clear()
+            print(f"{label}: {len(records)} rows")
+    except BaseException:
+        for sink in sinks.values():
+            sink.abort()
+        raise
+
+    written.update({sink.close(): sink.rows for sink in sinks.values()})
+    return written, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a bulk BIOS pull described by a JSON job file")
+    parser.add_argument("job", help="path to the JSON job file")
+    args = parser.parse_args()
+
+    job = load_job(args.job)
+    written, failed = run_job(job)
+
+    print("\n=== Batch Done ===")
+    for name, rows in written.items():
+        print(f"{name}: {rows} rows")
+    if failed:
+        print(f"{len(failed)} units failed; their finished pages are kept for the next run", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+CHECKPOINT_DIR = ".fetch_checkpoints"
+
+# Older checkpoints are thrown away rather than resumed: the data behind them may have changed
+CHECKPOINT_TTL = 24 * 60 * 60
+
+
+def fetch_key(endpoint, params, date_range=None):
+    """Stable id for one (endpoint, params, date range) fetch, independent of param order"""
+    payload = {"endpoint": endpoint, "params": params or {}}
+    if date_range:
+        payload["date_range"] = list(date_range)
+    payload = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _write_json(path, value):
+    # Write to a temp file first so a crash never leaves a half-written page behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """Finished pages of one paginated fetch, kept on local disk.
+
+    Each finished page is stored as its own JSON file, so an interrupted or
+    rerun fetch with the same endpoint, params and date range only requests
+    the pages that are still missing. A checkpoint older than `max_age`
+    seconds is discarded and the fetch starts over. Safe to use from several
+    worker threads.
+    """
+
+    def __init__(self, endpoint, params=None, root=CHECKPOINT_DIR, date_range=None, max_age=CHECKPOINT_TTL):
+        self.endpoint = endpoint
+        self.params = params or {}
+        self.path = os.path.join(root, fetch_key(endpoint, self.params, date_range))
+        meta_path = os.path.join(self.path, "meta.json")
+        created_at = self._created_at(meta_path)
+        if created_at is not None and (created_at is False or time.time() - created_at > max_age):
+            self.clear()
+            created_at = None
+        os.makedirs(self.path, exist_ok=True)
+        if created_at is None:
+            _write_json(meta_path, {"endpoint": endpoint, "params": self.params,
+                                    "date_range": [str(d) for d in date_range] if date_range else None,
+                                    "created_at": time.time()})
+
+    @staticmethod
+    def _created_at(meta_path):
+        """When the checkpoint was started, None when there is none, False when that is unknown"""
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                return json.load(f).get("created_at") or False
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return False
+
+    def _page_path(self, page):
+        return os.path.join(self.path, f"page_{int(page):06d}.json")
+
+    def done_pages(self):
+        """Page numbers already stored"""
+        return {
+            int(name[5:-5]) for name in os.listdir(self.path)
+            if name.startswith("page_") and name.endswith(".json")
+        }
+
+    def load(self, page):
+        """Stored value for `page`, or None if it has not finished yet"""
+        try:
+            with open(self._page_path(page), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, page, value):
+        _write_json(self._page_path(page), value)
+
+    def clear(self):
+        """Forget this fetch once its result has been safely stored elsewhere"""
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,269 @@
+"""Transaction coverage (days with a tgl_transaksi) kept as a memoized index per dataset.
+
+Parsing millions of dates on every Streamlit rerun is what made coverage
+slow, so each CoverageIndex keeps the sorted unique days it has seen and
+only parses again when the data changed. Change is detected cheaply: the
+same frame object with the same length is trusted as is; otherwise a
+fingerprint (the sum of the date column's row hashes) is compared, and when
+the old rows are an unchanged prefix only the appended rows are parsed.
+Datasets too large to load as a frame are summarised from the days or
+(entity, day) pairs a query returns, memoized on a version of the data.
+"""
+import weakref
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+DATE_COLUMN = "tgl_transaksi"
+ENTITY_COLUMNS = ["kdsatker", "no_rekening"]
+
+# Set bits per byte value, for counting days in packed rows
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+# Position (0 = highest bit) of the first and of the last set bit per byte value; 0 for an empty byte
+_BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(bool)
+_FIRST_BIT = _BYTE_BITS.argmax(axis=1)
+_LAST_BIT = 7 - _BYTE_BITS[:, ::-1].argmax(axis=1)
+
+
+def date_column(df):
+    """The transaction date column of `df`, or None"""
+    for col in df.columns:
+        if DATE_COLUMN in col.lower():
+            return col
+    return None
+
+
+def unique_days(values):
+    """Sorted unique calendar days in `values` as datetime64[D], ignoring unreadable dates"""
+    if values.dtype.kind != "M":
+        values = pd.to_datetime(values, errors="coerce", format="mixed")
+    days = values.to_numpy(dtype="datetime64[D]")
+    return np.unique(days[~np.isnat(days)])
+
+
+def _day_numbers(values):
+    """Days since the epoch as int64, with -1 for missing or unreadable dates"""
+    if values.dtype.kind != "M":
+        values = pd.to_datetime(values, errors="coerce", format="mixed")
+    days = values.to_numpy(dtype="datetime64[D]")
+    return np.where(np.isnat(days), -1, days.view("int64"))
+
+
+def _fingerprint(hashes):
+    return int(hashes.sum(dtype=np.uint64))
+
+
+class CoverageIndex:
+    """Unique transaction days of one dataset, updated incrementally"""
+
+    def __init__(self):
+        self.column = None
+        self.rows = 0
+        self.fingerprint = None
+        self.days = np.array([], dtype="datetime64[D]")
+        self._frame = None
+
+    def update(self, df):
+        """Bring the index in line with `df`; returns False when nothing had to be parsed"""
+        column = date_column(df)
+        if self._frame is not None and self._frame() is df and len(df) == self.rows and column == self.column:
+            return False
+        self._frame = weakref.ref(df)
+        if column is None:
+            self.column, self.rows, self.fingerprint = None, len(df), None
+            self.days = self.days[:0]
+            return True
+
+        hashes = hash_pandas_object(df[column], index=False).to_numpy()
+        fingerprint = _fingerprint(hashes)
+        if column == self.column and len(df) == self.rows and fingerprint == self.fingerprint:
+            return False
+        if column == self.column and len(df) > self.rows and _fingerprint(hashes[:self.rows]) == self.fingerprint:
+            # Only rows were appended: parse just those
+            self.days = np.union1d(self.days, unique_days(df[column].iloc[self.rows:]))
+        else:
+            self.days = unique_days(df[column])
+        self.column, self.rows, self.fingerprint = column, len(df), fingerprint
+        return True
+
+    def summary(self):
+        """unique_days, year_coverage and range_coverage (%), min_date, max_date and date_range_days"""
+        if not len(self.days):
+            return {"unique_days": 0, "year_coverage": 0, "range_coverage": 0,
+                    "min_date": None, "max_date": None, "date_range_days": 0}
+        min_date, max_date = self.days[0].astype(object), self.days[-1].astype(object)
+        date_range_days = (max_date - min_date).days + 1
+        return {
+            "unique_days": len(self.days),
+            # Share of a 365-day year, and of the span the data actually covers
+            "year_coverage": len(self.days) / 365 * 100,
+            "range_coverage": len(self.days) / date_range_days * 100,
+            "min_date": min_date,
+            "max_date": max_date,
+            "date_range_days": date_range_days,
+        }
+
+
+class CoverageCache:
+    """One CoverageIndex per dataset name, plus the last coverage matrix built for each"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._matrices = {}
+        self._versioned = {}
+
+    def coverage(self, name, df):
+        """Coverage summary of `df`, or None when it has no transaction date column"""
+        index = self._indexes.setdefault(name, CoverageIndex())
+        index.update(df)
+        return index.summary() if index.column else None
+
+    def matrix(self, name, df, entity):
+        """The CoverageMatrix of `df` by `entity`, rebuilt only when `df` is a different frame"""
+        cached = self._matrices.get((name, entity))
+        if cached and cached[0]() is df and cached[1] == len(df):
+            return cached[2]
+        matrix = CoverageMatrix(df, entity)
+        self._matrices[(name, entity)] = (weakref.ref(df), len(df), matrix)
+        return matrix
+
+    def coverage_of_days(self, name, version, load_days):
+        """Coverage summary of the dates `load_days()` returns, loaded again only when `version` changes"""
+        cached = self._versioned.get((name, None))
+        if cached is None or cached[0] != version:
+            index = CoverageIndex()
+            index.days = unique_days(pd.Series(load_days()))
+            cached = self._versioned[(name, None)] = (version, index.summary())
+        return cached[1]
+
+    def matrix_of_pairs(self, name, version, entity, load_pairs):
+        """The CoverageMatrix by `entity` of the (entity, date) rows `load_pairs()` returns, rebuilt when `version` changes"""
+        cached = self._versioned.get((name, entity))
+        if cached is None or cached[0] != version:
+            cached = self._versioned[(name, entity)] = (version, CoverageMatrix(load_pairs(), entity))
+        return cached[1]
+
+    def forget(self, name=None):
+        if name is None:
+            self._indexes.clear()
+            self._matrices.clear()
+            self._versioned.clear()
+        else:
+            self._indexes.pop(name, None)
+            self._matrices = {key: value for key, value in self._matrices.items() if key[0] != name}
+            self._versioned = {key: value for key, value in self._versioned.items() if key[0] != name}
+
+
+class CoverageMatrix:
+    """Which entity (kdsatker, no_rekening, ...) has transactions on which day, as packed bits.
+
+    Row i of `bits` is entity `entities[i]`; bit j is day `start + j`. One
+    byte holds eight days, so thousands of satkers over several years fit
+    in a few MB. The bits are set straight from the (entity, day) pairs and
+    the summaries read the packed bytes, unpacking at most CHUNK_CELLS
+    cells at a time, so the full one-bool-per-day grid never exists.
+    """
+
+    # Unpacked cells (entity x day bools) held at once by the summaries that need single days
+    CHUNK_CELLS = 1 << 22
+
+    def __init__(self, df, entity="kdsatker", date_col=None, start=None, end=None):
+        date_col = date_col or date_column(df)
+        days = _day_numbers(df[date_col])
+        codes, self.entities = pd.factorize(df[entity], sort=True)
+        valid = (codes >= 0) & (days >= 0)
+        present = days[valid]
+        self.start = np.datetime64(start, "D") if start is not None else (
+            np.datetime64(int(present.min()), "D") if len(present) else np.datetime64("today", "D"))
+        end = np.datetime64(end, "D") if end is not None else (
+            np.datetime64(int(present.max()), "D") if len(present) else self.start)
+        self.days = max(int((end - self.start).astype(int)) + 1, 0)
+        offsets = present - self.start.astype("int64")
+        inside = (offsets >= 0) & (offsets < self.days)
+
+        self.entity = entity
+        self.bits = np.zeros((len(self.entities), (self.days + 7) // 8), dtype=np.uint8)
+        # The (entity, day) cells in order, OR-ed together per byte (repeats fall in the same byte);
+        # as in np.packbits the first day of a byte is its highest bit
+        cells = np.sort(codes[valid][inside].astype(np.int64) * max(self.days, 1) + offsets[inside])
+        rows, offsets = np.divmod(cells, max(self.days, 1))
+        byte_index = rows * self.bits.shape[1] + (offsets >> 3)
+        firsts = np.flatnonzero(np.r_[True, byte_index[1:] != byte_index[:-1]]) if len(cells) else cells
+        values = (0x80 >> (offsets & 7)).astype(np.uint8)
+        self.bits.ravel()[byte_index[firsts]] = np.bitwise_or.reduceat(values, firsts) if len(cells) else values
+
+    def dates(self):
+        return self.start + np.arange(self.days)
+
+    def _chunks(self):
+        """(row slice, unpacked bool grid of those rows), a few rows at a time"""
+        step = max(1, self.CHUNK_CELLS // max(self.days, 1))
+        for first in range(0, len(self.entities), step):
+            rows = slice(first, first + step)
+            yield rows, np.unpackbits(self.bits[rows], axis=1, count=self.days).astype(bool)
+
+    def entity_coverage(self):
+        """Per entity: days with transactions, first and last such day, and the share of the range covered"""
+        present = _POPCOUNT[self.bits].sum(axis=1)
+        occupied = self.bits != 0
+        has_any = occupied.any(axis=1)
+        first_byte = occupied.argmax(axis=1)
+        last_byte = self.bits.shape[1] - 1 - occupied[:, ::-1].argmax(axis=1)
+        rows = np.arange(len(self.entities))
+        first = np.where(has_any, first_byte * 8 + _FIRST_BIT[self.bits[rows, first_byte]], 0)
+        last = np.where(has_any, last_byte * 8 + _LAST_BIT[self.bits[rows, last_byte]], 0)
+        dates = self.dates()
+        return pd.DataFrame({
+            self.entity: self.entities,
+            "days_present": present,
+            "days_missing": self.days - present,
+            "first_day": pd.Series(dates[first]).where(has_any),
+            "last_day": pd.Series(dates[last]).where(has_any),
+            "coverage": present / max(self.days, 1) * 100,
+        })
+
+    def gaps(self, min_days=1):
+        """Runs of consecutive days without transactions, one row per (entity, gap)"""
+        found = []
+        for rows, grid in self._chunks():
+            # Pad with "present" on both sides so every gap has a start and an end edge
+            padded = np.pad(grid, ((0, 0), (1, 1)), constant_values=True).view(np.int8)
+            edges = np.diff(padded, axis=1)
+            chunk_rows, starts = np.nonzero(edges == -1)
+            _, ends = np.nonzero(edges == 1)
+            # nonzero walks row by row, so the i-th start and i-th end belong to the same gap
+            lengths = ends - starts
+            keep = lengths >= min_days
+            found.append((chunk_rows[keep] + rows.start, starts[keep], lengths[keep]))
+        rows, starts, lengths = (np.concatenate(parts) for parts in zip(*found)) if found else (
+            np.array([], dtype=np.int64),) * 3
+        return pd.DataFrame({
+            self.entity: self.entities[rows],
+            "gap_start": self.start + starts,
+            "gap_end": self.start + starts + lengths - 1,
+            "days": lengths,
+        }).sort_values("days", ascending=False, ignore_index=True)
+
+    def daily(self):
+        """Per day, how many entities have transactions and what share of all entities that is"""
+        counts = np.zeros(self.days, dtype=np.int64)
+        for _, grid in self._chunks():
+            counts += grid.sum(axis=0)
+        return pd.DataFrame({
+            "date": self.dates(),
+            "entities": counts,
+            "share": counts / max(len(self.entities), 1) * 100,
+        })
+
+    def monthly(self):
+        """Entity x month table of the share of days with transactions, for the heatmap"""
+        months = self.dates().astype("datetime64[M]")
+        bounds = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        lengths = np.diff(np.r_[bounds, self.days])
+        present = np.zeros((len(self.entities), len(bounds)), dtype=np.int64)
+        if self.days:
+            for rows, grid in self._chunks():
+                present[rows] = np.add.reduceat(grid, bounds, axis=1)
+        return pd.DataFrame(present / np.maximum(lengths, 1) * 100, index=self.entities,
+                            columns=[str(month) for month in months[bounds]])
@@ -0,0 +1,56 @@
+"""Paged table view for the Streamlit pages, backed by the query engine.
+
+Only the visible page of rows is fetched from DuckDB; sorting and the
+text search run there too, so a multi-million-row dataset opens as fast
+as a small one. Column profiles are computed once per dataset version and
+kept in the session.
+"""
+import math
+
+import streamlit as st
+
+PAGE_SIZES = [25, 50, 100, 500]
+
+LABELS = {
+    "en": {"sort": "Sort by", "none": "(none)", "descending": "Descending", "search_in": "Search in",
+           "contains": "Contains", "rows": "Rows per page", "page": "Page", "showing": "Rows {start:,}–{end:,} of {total:,}"},
+    "id": {"sort": "Urutkan", "none": "(tidak ada)", "descending": "Menurun", "search_in": "Cari di",
+           "contains": "Mengandung", "rows": "Baris per halaman", "page": "Halaman", "showing": "Baris {start:,}–{end:,} dari {total:,}"},
+}
+
+
+def show_data_grid(engine, table, key, filters=None, lang="en", height=400):
+    """Sort / search controls and one page of `table`; `key` keeps the widgets of different grids apart"""
+    labels = LABELS[lang]
+    columns = list(engine.columns(table))
+    if not columns:
+        return
+
+    col1, col2, col3, col4, col5 = st.columns([2, 1, 2, 2, 1])
+    sort = col1.selectbox(labels["sort"], [labels["none"]] + columns, key=f"{key}_sort")
+    descending = col2.toggle(labels["descending"], key=f"{key}_desc")
+    search_column = col3.selectbox(labels["search_in"], columns, key=f"{key}_search_column")
+    text = col4.text_input(labels["contains"], key=f"{key}_search")
+    page_size = col5.selectbox(labels["rows"], PAGE_SIZES, key=f"{key}_page_size")
+
+    search = {search_column: text} if text else None
+    total = engine.count(table, filters, search)
+    pages = max(1, math.ceil(total / page_size))
+    page = st.number_input(labels["page"], min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    # The page may be past the end after a search narrowed the rows
+    page = min(page, pages)
+
+    rows = engine.page(table, (page - 1) * page_size, page_size,
+                       sort=None if sort == labels["none"] else sort, descending=descending,
+                       filters=filters, search=search)
+    st.dataframe(rows, use_container_width=True, height=height)
+    start = (page - 1) * page_size
+    st.caption(labels["showing"].format(start=min(start + 1, total), end=start + len(rows), total=total))
+
+
+def column_profile(engine, table, version):
+    """engine.profile(table), computed once per `version` of the data behind `table`"""
+    profiles = st.session_state.setdefault("column_profiles", {})
+    if profiles.get(table, (None,))[0] != version:
+        profiles[table] = (version, engine.profile(table))
+    return profiles[table][1]
@@ -0,0 +1,365 @@
+"""Local Parquet store for fetched datasets, partitioned by month.
+
+    datasets/
+        catalog.json
+        saldo_operasional/
+            month=2025-09/part-20250909021125-1a2b3c4d.parquet
+            month=unknown/part-...parquet
+            rollups/month=2025-09/kdbank.parquet
+
+Every write adds one part file per month it touches, using the
+`tgl_transaksi` column to pick the month (rows without a usable date go to
+month=unknown); an upsert instead merges the rows into those months on the
+dataset's natural key and leaves one file per month. catalog.json lists the datasets with their columns, row
+counts per month and where they came from, so pages can show what is
+available without opening any data file. Readers can ask for a few months
+and a few columns and only those files and column chunks are read. Each
+month also keeps its rollups (see rollups.py), updated on every write.
+
+    python dataset_store.py list
+    python dataset_store.py import saldo_data.csv --dataset saldo_operasional
+    python dataset_store.py compact saldo_operasional
+    python dataset_store.py rollups saldo_operasional
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from merge_engine import key_for, upsert
+from rollups import build_rollups, combine_all
+from saldo_schema import apply_schema
+
+STORE_DIR = "datasets"
+PARTITION_COLUMN = "tgl_transaksi"
+UNKNOWN_MONTH = "unknown"
+
+_catalog_lock = threading.RLock()
+
+
+def check_dataset_name(name):
+    """Return `name` if it can be a dataset folder; a name that could leave the store raises ValueError"""
+    if not name or name.strip() != name or "/" in name or "\\" in name or ".." in name:
+        raise ValueError(f"Invalid dataset name {name!r}: no path separators or '..'")
+    return name
+
+
+def partition_months(df, column=PARTITION_COLUMN):
+    """The YYYY-MM partition of every row, or UNKNOWN_MONTH when the date is missing or unreadable"""
+    if column not in df.columns:
+        return pd.Series(UNKNOWN_MONTH, index=df.index)
+    dates = pd.to_datetime(df[column], errors="coerce", format="mixed")
+    return dates.dt.strftime("%Y-%m").fillna(UNKNOWN_MONTH)
+
+
+class DatasetStore:
+    """Month-partitioned Parquet datasets under `root`, with a JSON catalog"""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.catalog_path = os.path.join(root, "catalog.json")
+
+    def _dataset_dir(self, dataset):
+        return os.path.join(self.root, check_dataset_name(dataset))
+
+    def _month_dir(self, dataset, month):
+        return os.path.join(self._dataset_dir(dataset), f"month={month}")
+
+    def _rollup_dir(self, dataset, month):
+        return os.path.join(self._dataset_dir(dataset), "rollups", f"month={month}")
+
+    def catalog(self):
+        """{dataset: {"source", "columns", "rows", "partitions": {month: rows}, "updated_at"}}"""
+        try:
+            with open(self.catalog_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_catalog(self, catalog):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.catalog_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, indent=2)
+        os.replace(tmp_path, self.catalog_path)
+
+    def datasets(self):
+        return sorted(self.catalog())
+
+    def months(self, dataset):
+        return sorted(self.catalog().get(dataset, {}).get("partitions", {}))
+
+    def _prepare(self, df):
+        # Known saldo columns get their compact types; everything else is kept as text,
+        # like PageSink does, so pages with mixed types cannot clash
+        df = apply_schema(df)
+        text_columns = [col for col in df.columns if df[col].dtype == object or pd.api.types.is_string_dtype(df[col])]
+        df[text_columns] = df[text_columns].astype("string")
+        return df
+
+    def _write_part(self, dataset, month, df):
+        folder = self._month_dir(dataset, month)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.parquet")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, f"{path}.partial", compression="zstd")
+        os.replace(f"{path}.partial", path)
+        return path
+
+    @staticmethod
+    def _catalog_entry(catalog, dataset, columns, source):
+        entry = catalog.setdefault(dataset, {"source": source, "columns": [], "rows": 0, "partitions": {}})
+        entry["columns"] += [col for col in columns if col not in entry["columns"]]
+        entry["source"] = source or entry.get("source")
+        entry["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        return entry
+
+    def write(self, dataset, data, source=None):
+        """Append a DataFrame or a list of records to `dataset`; returns the number of rows written"""
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data, dtype=object)
+        if df.empty:
+            return 0
+        df = self._prepare(df)
+
+        written = {}
+        for month, part in df.groupby(partition_months(df), sort=True):
+            with _catalog_lock:
+                previous = self._read_rollups(dataset, month) if self.files(dataset, [month]) else {}
+                self._write_part(dataset, month, part)
+                if previous is None:
+                    # Written before rollups existed: summarise the whole month once
+                    self.build_rollups(dataset, month)
+                else:
+                    self._write_rollups(dataset, month, combine_all([previous, build_rollups(part)]))
+            written[month] = len(part)
+
+        with _catalog_lock:
+            catalog = self.catalog()
+            entry = self._catalog_entry(catalog, dataset, df.columns, source)
+            for month, rows in written.items():
+                entry["partitions"][month] = entry["partitions"].get(month, 0) + rows
+            entry["rows"] = sum(entry["partitions"].values())
+            self._save_catalog(catalog)
+        return len(df)
+
+    def upsert(self, dataset, data, key=None, source=None):
+        """Merge rows into `dataset` so it keeps one row per natural key; returns the merge stats.
+
+        Each month the rows touch is read, merged with merge_engine.upsert()
+        and rewritten as a single part file, so re-fetching an overlapping
+        range replaces rows instead of stacking another copy. `key` defaults
+        to the one remembered in the catalog, then to merge_engine.key_for().
+        """
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data, dtype=object)
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0}
+        if df.empty:
+            return stats
+        df = self._prepare(df)
+        key = key or self.catalog().get(dataset, {}).get("key") or key_for(dataset, df.columns)
+
+        with _catalog_lock:
+            sizes = {}
+            for month, part in df.groupby(partition_months(df), sort=True):
+                old_paths = self.files(dataset, [month])
+                existing = self.read(dataset, months=[month]) if old_paths else None
+                merged, part_stats = upsert(existing, part, key)
+                for name, count in part_stats.items():
+                    stats[name] += count
+                merged = self._prepare(merged)
+                self._write_part(dataset, month, merged)
+                for path in old_paths:
+                    os.remove(path)
+                self._write_rollups(dataset, month, build_rollups(merged))
+                sizes[month] = len(merged)
+
+            catalog = self.catalog()
+            entry = self._catalog_entry(catalog, dataset, df.columns, source)
+            entry["partitions"].update(sizes)
+            entry["rows"] = sum(entry["partitions"].values())
+            entry["key"] = key
+            self._save_catalog(catalog)
+        return stats
+
+    def deduplicate(self, dataset, months=None, key=None):
+        """Merge each of `months` (all by default) into one part file with one row per natural key.
+
+        The bulk form of upsert(): append many batches with write(), then
+        settle every month they touched once, instead of rewriting a month
+        per batch. Among duplicates the later write wins, as with upsert().
+        Returns the number of rows the months hold afterwards.
+        """
+        entry = self.catalog().get(dataset, {})
+        key = key or entry.get("key") or key_for(dataset, entry.get("columns", []))
+        with _catalog_lock:
+            sizes = {}
+            for month in self.months(dataset) if months is None else months:
+                old_paths = self.files(dataset, [month])
+                if not old_paths:
+                    continue
+                merged, _ = upsert(None, self.read(dataset, months=[month]), key)
+                merged = self._prepare(merged)
+                self._write_part(dataset, month, merged)
+                for path in old_paths:
+                    os.remove(path)
+                self._write_rollups(dataset, month, build_rollups(merged))
+                sizes[month] = len(merged)
+
+            catalog = self.catalog()
+            if dataset in catalog:
+                entry = catalog[dataset]
+                entry["partitions"].update(sizes)
+                entry["rows"] = sum(entry["partitions"].values())
+                entry["key"] = key
+                self._save_catalog(catalog)
+        return sum(sizes.values())
+
+    def files(self, dataset, months=None):
+        """Part files of `dataset`, limited to `months` (a list of YYYY-MM) when given"""
+        dataset_dir = self._dataset_dir(dataset)
+        if not os.path.isdir(dataset_dir):
+            return []
+        paths = []
+        for name in sorted(os.listdir(dataset_dir)):
+            if not name.startswith("month=") or (months is not None and name[len("month="):] not in months):
+                continue
+            folder = os.path.join(dataset_dir, name)
+            paths += [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".parquet")]
+        return paths
+
+    def scan(self, dataset, months=None):
+        """A pyarrow Dataset over the selected partitions, or None when there is nothing to read"""
+        paths = self.files(dataset, months)
+        if not paths:
+            return None
+        # Older parts may lack columns added later; the unified schema fills them with nulls
+        schema = pa.unify_schemas([pq.read_schema(path) for path in paths])
+        return ds.dataset(paths, schema=schema, format="parquet")
+
+    def read(self, dataset, columns=None, months=None, filter=None):
+        """Load `dataset` as a DataFrame, reading only the given months, columns and matching rows.
+
+        `filter` is a pyarrow compute expression such as
+        `ds.field("kdsatker") == "415582"`, evaluated while scanning.
+        """
+        scan = self.scan(dataset, months)
+        if scan is None:
+            return pd.DataFrame(columns=columns or self.catalog().get(dataset, {}).get("columns", []))
+        if columns is not None:
+            columns = [col for col in columns if col in scan.schema.names]
+        # Parquet keeps the values typed but hands categoricals back as plain strings
+        return apply_schema(scan.to_table(columns=columns, filter=filter).to_pandas())
+
+    def empty_frame(self, dataset, months=None):
+        """A DataFrame without rows but with the columns and types read() would return"""
+        scan = self.scan(dataset, months)
+        if scan is None:
+            return pd.DataFrame(columns=self.catalog().get(dataset, {}).get("columns", []))
+        return apply_schema(scan.schema.empty_table().to_pandas())
+
+    def batches(self, dataset, months=None, batch_rows=100_000):
+        """The selected months of `dataset` as DataFrames of at most `batch_rows` rows, without loading it whole"""
+        scan = self.scan(dataset, months)
+        if scan is None:
+            return
+        for batch in scan.to_batches(batch_size=batch_rows):
+            if batch.num_rows:
+                yield apply_schema(batch.to_pandas())
+
+    def size(self, dataset, months=None):
+        """Bytes on disk of the selected months of `dataset`"""
+        return sum(os.path.getsize(path) for path in self.files(dataset, months))
+
+    def _write_rollups(self, dataset, month, rollups):
+        folder = self._rollup_dir(dataset, month)
+        # The folder exists even when no rollup applies, which marks the month as done
+        os.makedirs(folder, exist_ok=True)
+        for name, frame in rollups.items():
+            path = os.path.join(folder, f"{name}.parquet")
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), f"{path}.partial")
+            os.replace(f"{path}.partial", path)
+
+    def _read_rollups(self, dataset, month):
+        """The stored rollups of one month, or None when they were never built"""
+        folder = self._rollup_dir(dataset, month)
+        if not os.path.isdir(folder):
+            return None
+        return {name[:-len(".parquet")]: pq.read_table(os.path.join(folder, name)).to_pandas()
+                for name in sorted(os.listdir(folder)) if name.endswith(".parquet")}
+
+    def build_rollups(self, dataset, month):
+        """Summarise one month from its rows and store the result; returns the rollups"""
+        rollups = build_rollups(self.read(dataset, months=[month]))
+        with _catalog_lock:
+            shutil.rmtree(self._rollup_dir(dataset, month), ignore_errors=True)
+            self._write_rollups(dataset, month, rollups)
+        return rollups
+
+    def rollups(self, dataset, months=None):
+        """{rollup name: DataFrame} over the given months (all by default), building any that are missing"""
+        months = self.months(dataset) if months is None else months
+        stored = []
+        for month in months:
+            rollups = self._read_rollups(dataset, month)
+            stored.append(rollups if rollups is not None else self.build_rollups(dataset, month))
+        return combine_all(stored)
+
+    def compact(self, dataset):
+        """Merge the part files of each month into one; returns the number of files removed"""
+        removed = 0
+        for month in self.months(dataset):
+            paths = self.files(dataset, [month])
+            if len(paths) < 2:
+                continue
+            self._write_part(dataset, month, self.read(dataset, months=[month]))
+            for old in paths:
+                os.remove(old)
+            removed += len(paths) - 1
+        return removed
+
+    def delete(self, dataset):
+        shutil.rmtree(self._dataset_dir(dataset), ignore_errors=True)
+        with _catalog_lock:
+            catalog = self.catalog()
+            catalog.pop(dataset, None)
+            self._save_catalog(catalog)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and maintain the local dataset store")
+    parser.add_argument("--root", default=STORE_DIR, help="store folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the datasets in the catalog")
+    import_cmd = commands.add_parser("import", help="load a CSV file (e.g. saldo_data.csv) into the store")
+    import_cmd.add_argument("csv")
+    import_cmd.add_argument("--dataset", help="dataset name (default: the file name)")
+    compact_cmd = commands.add_parser("compact", help="merge the part files of each month")
+    compact_cmd.add_argument("dataset")
+    rollups_cmd = commands.add_parser("rollups", help="rebuild the per-month rollups from the rows")
+    rollups_cmd.add_argument("dataset")
+    args = parser.parse_args()
+
+    store = DatasetStore(args.root)
+    if args.command == "list":
+        for name, entry in sorted(store.catalog().items()):
+            print(f"{name}: {entry['rows']} rows in {len(entry['partitions'])} months, updated {entry.get('updated_at')}")
+    elif args.command == "import":
+        dataset = args.dataset or os.path.splitext(os.path.basename(args.csv))[0]
+        # Codes such as kddept 024 must keep their leading zeros
+        rows = 0
+        for chunk in pd.read_csv(args.csv, dtype=str, keep_default_na=False, chunksize=100_000):
+            rows += store.write(dataset, chunk, source=args.csv)
+        print(f"Imported {rows} rows into {dataset}")
+    elif args.command == "compact":
+        print(f"Removed {store.compact(args.dataset)} part files from {args.dataset}")
+    elif args.command == "rollups":
+        for month in store.months(args.dataset):
+            store.build_rollups(args.dataset, month)
+        print(f"Rebuilt the rollups of {len(store.months(args.dataset))} months of {args.dataset}")
@@ -0,0 +1,57 @@
+"""Shrink long series before they reach Plotly, so a figure stays a few thousand points.
+
+Plotly ships every point to the browser as JSON. Two reductions are used:
+counts and sums are additive, so a long daily series is re-bucketed into
+weeks or months (bucket_series); for values that cannot be added up, such
+as a share or a balance, lttb() keeps the points that preserve the shape
+of the line (Largest-Triangle-Three-Buckets, Steinarsson 2013).
+"""
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 2000
+
+# Coarser and coarser time buckets tried by bucket_series
+FREQUENCIES = [("D", "day"), ("W", "week"), ("M", "month"), ("Q", "quarter"), ("Y", "year")]
+
+
+def bucket_series(df, x, y, max_points=MAX_POINTS):
+    """Sum `y` over the finest time bucket that leaves at most `max_points` rows; returns (frame, bucket name)"""
+    dates = pd.to_datetime(df[x])
+    for freq, name in FREQUENCIES:
+        buckets = dates.dt.to_period(freq).dt.start_time.rename(x)
+        if buckets.nunique() <= max_points or freq == FREQUENCIES[-1][0]:
+            return df[[y]].groupby(buckets, sort=True).sum().reset_index(), name
+
+
+def lttb(x, y, max_points=MAX_POINTS):
+    """Indices of the at most `max_points` points of (x, y) that keep the line's visual shape"""
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # First and last points are always kept; the rest is split into equal buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # The next bucket's average is the third corner of the triangle
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        keep[i + 1] = previous
+    return keep
+
+
+def downsample(df, x, y, max_points=MAX_POINTS):
+    """The rows of `df` (sorted by `x`) that lttb() keeps for the line of `y` over `x`"""
+    df = df.sort_values(x)
+    x_values = df[x]
+    if pd.api.types.is_datetime64_any_dtype(x_values):
+        x_values = x_values.astype("int64")
+    return df.iloc[lttb(x_values.to_numpy(), df[y].to_numpy(dtype="float64", na_value=np.nan), max_points)]
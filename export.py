@@ -0,0 +1,247 @@
+"""Export datasets to CSV, gzip-compressed CSV, Parquet or Excel, batch by batch.
+
+Rows come in as an iterator of DataFrame batches (slices of a frame in
+the session, or a PageSink file read in chunks) and every
+writer appends one batch at a time, so an export never holds more than
+one batch next to the data it reads. Excel is written by openpyxl in
+write-only mode, which streams rows to disk, and continues on a new sheet
+when one is full. Exports run as background jobs into a temporary file
+that the download button then serves; show_exports() is the panel both
+pages use for that, and files nobody dismissed are removed after a day.
+"""
+import glob
+import gzip
+import os
+import tempfile
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from fetch_engine import FetchCancelled, check_cancelled, new_progress
+from jobs import JobManager
+
+BATCH_ROWS = 100_000
+
+# Format -> (label, file suffix, MIME type)
+FORMATS = {
+    "csv": ("CSV", ".csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+    "xlsx": ("Excel", ".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# Rows on one Excel sheet, the header row included
+EXCEL_MAX_ROWS = 1_048_576
+
+# Finished exports (and their files) older than this are removed, dismissed or not
+EXPORT_TTL = 24 * 60 * 60
+
+TEMP_PREFIX = "bios-export-"
+
+LABELS = {
+    "en": {"rows": "{records:,} of {total:,} rows", "cancel": "⏹️ Cancel", "failed": "❌ Export failed: {error}",
+           "expired": "The export file is gone; export again.", "dismiss": "🗑️ Dismiss"},
+    "id": {"rows": "{records:,} dari {total:,} baris", "cancel": "⏹️ Batalkan", "failed": "Ekspor gagal: {error}",
+           "expired": "File ekspor sudah dihapus; ekspor ulang.", "dismiss": "🗑️ Tutup"},
+}
+
+
+def frame_batches(df, batch_rows=BATCH_ROWS):
+    """Slices of an in-memory DataFrame (views, not copies)"""
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows]
+
+
+def _write_csv(batches, path, compress, on_batch):
+    opener = gzip.open if compress else open
+    rows = 0
+    with opener(path, "wt", encoding="utf-8", newline="") as f:
+        for batch in batches:
+            batch.to_csv(f, header=rows == 0, index=False)
+            rows += len(batch)
+            on_batch(rows)
+    return rows
+
+
+def _file_schema(schema):
+    """`schema` with columns that are all missing (type null) as strings, so later batches can fill them"""
+    fields = [field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _write_parquet(batches, path, on_batch):
+    writer = None
+    rows = 0
+    try:
+        for batch in batches:
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if writer is None:
+                # The file schema is fixed by the first batch; an empty column there says nothing about its type
+                writer = pq.ParquetWriter(path, _file_schema(table.schema), compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+            rows += len(batch)
+            on_batch(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        # Nothing to export: still a valid, empty file
+        pq.write_table(pa.table({}), path)
+    return rows
+
+
+def _write_excel(batches, path, on_batch):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    rows = 0
+    for batch in batches:
+        # openpyxl wants plain Python values and None for missing ones
+        values = batch.astype(object).where(batch.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if sheet is None or sheet_rows == EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Sheet{len(workbook.worksheets) + 1}")
+                sheet.append([str(col) for col in batch.columns])
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+        rows += len(batch)
+        on_batch(rows)
+    if sheet is None:
+        workbook.create_sheet("Sheet1")
+    workbook.save(path)
+    return rows
+
+
+def write_export(batches, path, fmt, on_batch=None, cancel=None):
+    """Write the batches to `path` in `fmt` (a FORMATS key); returns the number of rows written"""
+    def step(rows):
+        check_cancelled(cancel)
+        if on_batch:
+            on_batch(rows)
+
+    if fmt in ("csv", "csv.gz"):
+        return _write_csv(batches, path, fmt == "csv.gz", step)
+    if fmt == "parquet":
+        return _write_parquet(batches, path, step)
+    if fmt == "xlsx":
+        return _write_excel(batches, path, step)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def start_export(name, batches, fmt, total_rows=None):
+    """Write the export to a temporary file on a background job; the job's result is the file path"""
+    def run(job):
+        progress = job.progress[name] = new_progress()
+        progress["status"] = "running"
+        # Batches are counted as pages; the row total lets pages show how far along it is
+        progress["total_records"] = total_rows
+
+        def on_batch(rows):
+            progress["pages"] += 1
+            progress["records"] = rows
+
+        fd, path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=FORMATS[fmt][1])
+        os.close(fd)
+        try:
+            write_export(batches, path, fmt, on_batch, job.cancel_event)
+        except BaseException as e:
+            os.remove(path)
+            progress["status"] = "cancelled" if isinstance(e, FetchCancelled) else "failed"
+            raise
+        progress["status"] = "done"
+        return path
+
+    remove_stale_exports()
+    return get_export_manager().submit(name, run)
+
+
+def discard_export(job):
+    """Forget a finished export job and delete its file"""
+    if job.finished:
+        get_export_manager().forget(job.id)
+        if job.result and os.path.exists(job.result):
+            os.remove(job.result)
+
+
+def remove_stale_exports(max_age=EXPORT_TTL):
+    """Discard exports finished more than `max_age` seconds ago, and export files an earlier run left behind"""
+    manager = get_export_manager()
+    cutoff = time.time() - max_age
+    for job in manager.jobs():
+        if job.finished and job.finished_at < cutoff:
+            discard_export(job)
+    known = {job.result for job in manager.jobs()}
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), TEMP_PREFIX + "*")):
+        try:
+            if path not in known and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            # Another session may have removed it first
+            pass
+
+
+def _file_reader(path):
+    """A callable for st.download_button (Streamlit 1.52+): the file is read when the button is clicked, not on every refresh.
+
+    Streamlit serves a download from memory, so the click still loads the
+    whole export once; only writing it streams through the disk.
+    """
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+
+def dismiss_export(job):
+    discard_export(job)
+    st.session_state.export_jobs.pop(job.id, None)
+
+
+@st.fragment(run_every=2)
+def show_exports(lang="en"):
+    """This session's exports (st.session_state.export_jobs): progress while they are written, then a download button"""
+    labels = LABELS[lang]
+    export_jobs = st.session_state.setdefault("export_jobs", {})
+    for job_id, (file_name, export_format) in list(export_jobs.items()):
+        job = get_export_manager().get(job_id)
+        if job is None:
+            export_jobs.pop(job_id, None)
+            continue
+        progress = job.progress.get(job.name, {})
+        with st.container(border=True):
+            st.markdown(f"**{file_name}** — {job.status}")
+            if not job.finished:
+                total = progress.get("total_records")
+                if total:
+                    st.progress(min(1.0, progress["records"] / total),
+                                text=labels["rows"].format(records=progress["records"], total=total))
+                st.button(labels["cancel"], key=f"cancel_export_{job.id}", on_click=job.cancel, disabled=job.cancelled)
+                continue
+            if job.status == "done" and os.path.exists(job.result):
+                # Served from the temporary file; the rows are not held in memory again
+                st.download_button(f"📥 Download {file_name}", data=_file_reader(job.result), file_name=file_name,
+                                   mime=FORMATS[export_format][2], key=f"download_{job.id}")
+            elif job.status == "done":
+                st.warning(labels["expired"])
+            elif job.error:
+                st.error(labels["failed"].format(error=job.error))
+            st.button(labels["dismiss"], key=f"dismiss_export_{job.id}", on_click=dismiss_export, args=(job,))
+
+
+_export_manager = None
+_export_manager_lock = threading.Lock()
+
+
+def get_export_manager():
+    """Return the process-wide manager for export jobs, kept apart from the fetch jobs"""
+    global _export_manager
+    with _export_manager_lock:
+        if _export_manager is None:
+            _export_manager = JobManager(max_workers=1)
+        return _export_manager
@@ -0,0 +1,315 @@
+"""Paginated BIOS fetching shared by the Streamlit pages, the CLI scripts and batch_runner.py.
+
+Nothing in here touches Streamlit: progress is reported through plain dicts
+and callbacks, so the same code runs in a browser session, a script or a
+scheduled job.
+"""
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from checkpoint import Checkpoint
+from http_client import get_client
+from sharding import fetch_sharded
+
+
+class FetchError(Exception):
+    """A page could not be fetched or does not look like a BIOS response"""
+
+
+class FetchCancelled(FetchError):
+    """The fetch was stopped through its `cancel` event"""
+
+
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise FetchCancelled("Fetch cancelled")
+
+
+def new_progress():
+    """Counters a fetch updates while it runs; safe to read from another thread"""
+    return {"status": "queued", "pages": 0, "total_pages": None, "records": 0, "resumed": 0, "error": None}
+
+
+def data_block(payload):
+    """The `data` block of a paginated BIOS response (the one holding `datas`), or None"""
+    if isinstance(payload, dict) and isinstance(payload.get("data"), dict) and "datas" in payload["data"]:
+        return payload["data"]
+    return None
+
+
+def page_count(block):
+    """Number of pages the server reports: `pageCount`, or `total` / `size`"""
+    if block.get("pageCount") is not None:
+        return int(block["pageCount"])
+    total = int(block.get("total", 0))
+    page_size = int(block.get("size", 20)) or 20
+    return (total + page_size - 1) // page_size
+
+
+class EndpointRequest:
+    """How to request the pages of one paginated BIOS endpoint.
+
+    `params` go in the body, as form fields or JSON depending on `body`. The
+    page number goes in the form (`page_in="form"`) or in the query string
+    (`page_in="query"`, as the saldo_operasional scripts do).
+    """
+
+    def __init__(self, endpoint, params=None, auth=None, headers=None, page_in="form", body="form",
+                 cache=None, scheduler=None):
+        self.endpoint = endpoint
+        self.params = dict(params or {})
+        self.auth = auth
+        self.headers = headers
+        self.page_in = page_in
+        self.body = body
+        self.cache = cache
+        self.scheduler = scheduler
+
+    def with_params(self, **extra):
+        """Same request with some params replaced, e.g. one date window"""
+        return EndpointRequest(self.endpoint, {**self.params, **extra}, self.auth, self.headers,
+                               self.page_in, self.body, self.cache, self.scheduler)
+
+    def fetch_page(self, page, checkpoint=None):
+        """The `data` block of one page, from `checkpoint` when it already holds it"""
+        if checkpoint:
+            block = checkpoint.load(page)
+            if block is not None:
+                return block
+
+        url = self.endpoint
+        params = dict(self.params)
+        if self.page_in == "query":
+            url = f"{url}{'&' if '?' in url else '?'}page={page}"
+        else:
+            params["page"] = str(page)
+        body = {"json": params or None} if self.body == "json" else {"data": params}
+
+        slot = self.scheduler.request_slot(url) if self.scheduler else nullcontext()
+        with slot:
+            response = get_client().post(url, headers=self.headers, auth=self.auth, cache=self.cache, **body)
+
+        if response.status_code != 200:
+            raise FetchError(f"HTTP {response.status_code} on page {page}: {response.text[:200]}")
+        try:
+            block = data_block(response.json())
+        except ValueError:
+            raise FetchError(f"Page {page} is not JSON")
+        if block is None:
+            raise FetchError(f"Page {page} has no data.datas block")
+
+        if checkpoint and block["datas"]:
+            checkpoint.save(page, block)
+        return block
+
+
+def log_page(page, rows):
+    """`on_page` callback for the CLI scripts"""
+    print(f"Fetched page {page} ({rows} rows)")
+
+
+def fetch_all_pages(request, first_page=0, max_pages=None, concurrency=1, checkpoint=None,
+                    progress=None, emit=None, on_page=None, partial_ok=False, cancel=None, first_block=None,
+                    require_page_count=False):
+    """Fetch every page of one endpoint, `concurrency` pages at a time after the first.
+
+    The first page tells us the page count; the rest are requested in
+    parallel and consumed in page order, stopping at the first empty page.
+    Records go to `emit(records)` page by page when given, otherwise they are
+    collected and returned. With `partial_ok` an error after the first page
+    is recorded in `progress["error"]` and the records so far are kept;
+    without it the error is raised. Setting the `cancel` event (a
+    threading.Event) stops the fetch with FetchCancelled before the next page.
+    `first_block` is the already fetched block of `first_page`, e.g. from a
+    probe, so it is not requested again. With `require_page_count` a first
+    page that holds rows but no usable page count raises FetchError instead
+    of being taken as the only page.
+    """
+    progress = progress if progress is not None else new_progress()
+    records = []
+    collect = emit or records.extend
+
+    progress["status"] = "fetching"
+    if checkpoint:
+        progress["resumed"] += len(checkpoint.done_pages())
+
+    def fetch_page(page):
+        check_cancelled(cancel)
+        return request.fetch_page(page, checkpoint)
+
+    if first_block is None:
+        first = fetch_page(first_page)
+    else:
+        first = first_block
+        if checkpoint and first["datas"]:
+            checkpoint.save(first_page, first)
+    if not first["datas"]:  # No data at all
+        return records
+
+    last_page = page_count(first)
+    if require_page_count and last_page == 0:
+        raise FetchError("Could not determine total pages from API response")
+    if max_pages is not None:
+        last_page = min(last_page, max_pages)
+    remaining_pages = range(first_page + 1, last_page + 1)
+
+    # Counters add up, since several date windows of one endpoint may share this progress
+    progress["total_pages"] = (progress["total_pages"] or 0) + len(remaining_pages) + 1
+    progress["pages"] += 1
+    progress["records"] += len(first["datas"])
+    collect(first["datas"])
+    if on_page:
+        on_page(first_page, len(first["datas"]))
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = {page: executor.submit(fetch_page, page) for page in remaining_pages}
+
+        # Collect in page order so records keep the server's ordering
+        for page in remaining_pages:
+            try:
+                block = futures[page].result()
+            except FetchCancelled:
+                raise
+            except Exception as e:
+                if not partial_ok:
+                    raise
+                progress["error"] = f"Error on page {page}: {e}"
+                break
+
+            if not block["datas"]:  # No more data
+                break
+
+            progress["pages"] += 1
+            progress["records"] += len(block["datas"])
+            collect(block["datas"])
+            if on_page:
+                on_page(page, len(block["datas"]))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return records
+
+
+def fetch_endpoint(request, first_page=0, max_pages=None, concurrency=1, resume=False,
+                   shard_unit=None, from_date=None, to_date=None, shard_workers=4, dense_threshold=5000,
+                   progress=None, emit=None, on_page=None, partial_ok=False, cancel=None):
+    """Fetch one endpoint, optionally split into parallel date windows and resumable from checkpoints.
+
+    Returns (records, checkpoints). `records` is empty when `emit` is given.
+    The checkpoints should be cleared once the records are stored safely.
+    """
+    progress = progress if progress is not None else new_progress()
+
+    if not shard_unit:
+        checkpoint = Checkpoint(request.endpoint, request.params, date_range=(from_date, to_date)) if resume else None
+        records = fetch_all_pages(request, first_page, max_pages, concurrency, checkpoint,
+                                  progress, emit, on_page, partial_ok, cancel)
+        return records, [checkpoint] if checkpoint else []
+
+    checkpoints = []
+
+    def window_request(start, end):
+        return request.with_params(from_date=start.isoformat(), to_date=end.isoformat())
+
+    def probe_window(start, end):
+        check_cancelled(cancel)
+        block = window_request(start, end).fetch_page(first_page)
+        return int(block.get("total", 0)), block
+
+    def fetch_window(start, end, probe, emit_page):
+        window = window_request(start, end)
+        checkpoint = Checkpoint(window.endpoint, window.params) if resume else None
+        if checkpoint:
+            checkpoints.append(checkpoint)
+        fetch_all_pages(window, first_page, max_pages, concurrency, checkpoint,
+                        progress, emit_page, on_page, partial_ok, cancel, first_block=probe)
+
+    records = []
+    _, failed = fetch_sharded(from_date, to_date, fetch_window, emit or records.extend, unit=shard_unit,
+                              max_workers=shard_workers, probe_window=probe_window, dense_threshold=dense_threshold)
+    check_cancelled(cancel)
+    if failed:
+        if not partial_ok:
+            raise failed[0][1]
+        progress["error"] = f"{len(failed)} date windows failed, first {failed[0][0]}: {failed[0][1]}"
+    return records, checkpoints
+
+
+def datatables_page(url, params, tuner, start=0, draw=1, auth=None, headers=None):
+    """One DataTables page at offset `start`, retried with a smaller page after a read timeout.
+
+    Returns (response, json, length asked for); fetch_datatables() accepts
+    this as its `first_page`.
+    """
+    client = get_client()
+    while True:
+        page_params = {**params, "draw": draw, "start": start, "length": tuner.size}
+        try:
+            r = client.get(url, params=page_params, headers=headers, auth=auth, retry_read_timeouts=False)
+        except requests.ReadTimeout:
+            if tuner.on_timeout(page_params["length"]):
+                continue
+            raise FetchError("Read timeout even at the smallest page size")
+
+        if r.status_code == 401:
+            raise FetchError("401 Unauthorized — token invalid or expired")
+        if r.status_code != 200:
+            raise FetchError(f"Server error ({r.status_code}): {r.text[:500]}")
+        return r, r.json(), page_params["length"]
+
+
+def datatables_total(js):
+    """recordsFiltered (or recordsTotal) of a DataTables response as an int, or None when it has neither"""
+    total = js.get("recordsFiltered", js.get("recordsTotal"))
+    return None if total is None else int(total)
+
+
+def fetch_datatables(url, params, emit, tuner, auth=None, headers=None, cancel=None, first_page=None):
+    """Walk the DataTables-style `start`/`length` pages of `url`, passing each page's rows to `emit`.
+
+    The page length comes from `tuner` (a PageSizeTuner). After a read timeout
+    the same offset is retried with a smaller page. Returns the number of rows.
+    Setting the `cancel` event stops the walk with FetchCancelled.
+    `first_page` is the datatables_page() result at offset 0, e.g. from a
+    probe, so it is not requested again.
+    """
+    draw = 1
+    start = 0
+    while True:
+        check_cancelled(cancel)
+        if start == 0 and first_page is not None:
+            r, js, requested = first_page
+        else:
+            r, js, requested = datatables_page(url, params, tuner, start, draw, auth, headers)
+
+        records = js.get("data") or js.get("records") or js.get("aaData") or []
+        if not records:
+            return start
+
+        emit(records)
+        start += len(records)
+        draw += 1
+
+        # recordsFiltered/recordsTotal (DataTables) tell us whether a short page is really the last one
+        total = datatables_total(js)
+        if total is not None:
+            if start >= total:
+                return start
+            if len(records) < requested:
+                tuner.cap(len(records))
+        elif len(records) < requested:
+            return start
+
+        # Only a request that went to the server says anything about the page size (not a cache hit)
+        if hasattr(r, "request_seconds"):
+            tuner.record(r.request_seconds, len(r.content), requested)
+
+
+def fetch_single(url, params=None, auth=None):
+    """One unpaginated POST, returning the decoded JSON"""
+    response = get_client().post(url, auth=auth, data=params or {})
+    response.raise_for_status()
+    return response.json()
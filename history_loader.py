@@ -0,0 +1,130 @@
+"""Stream large CSV/Parquet history exports into the dataset store, keeping only the slice asked for.
+
+DuckDB does the reading: it parses the file in parallel and streams the
+result back in batches. Only the selected columns are materialised. The
+kdsatker / kdbank / date filters are applied while scanning; for Parquet
+they also skip whole row groups. Memory stays at about one batch, so one
+satker's slice of a multi-GB export loads in seconds.
+
+    python history_loader.py saldo_history.csv --dataset saldo --kdsatker 415582 --from 2024-01-01
+
+The Streamlit page only imports files from IMPORT_DIR (BIOS_IMPORT_DIR),
+so a browser session cannot read arbitrary files on the server.
+"""
+import argparse
+import os
+
+import duckdb
+
+from dataset_store import PARTITION_COLUMN, DatasetStore, check_dataset_name
+from query_engine import file_source, quote_ident, where_clause
+
+BATCH_ROWS = 200_000
+
+IMPORT_DIR = os.environ.get("BIOS_IMPORT_DIR", "imports")
+IMPORT_SUFFIXES = (".csv", ".parquet")
+
+
+def import_files(root=IMPORT_DIR):
+    """The CSV and Parquet files under `root`, as paths relative to it"""
+    found = []
+    for folder, _, names in os.walk(root):
+        found += [os.path.relpath(os.path.join(folder, name), root) for name in names if name.endswith(IMPORT_SUFFIXES)]
+    return sorted(found)
+
+
+def import_path(name, root=IMPORT_DIR):
+    """The real path of `name` inside `root`; anything that resolves outside it raises ValueError"""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or not path.endswith(IMPORT_SUFFIXES):
+        raise ValueError(f"{name} is not a CSV or Parquet file in {root}")
+    return path
+
+
+def file_columns(path):
+    """Column names of a CSV or Parquet file, read from its header or footer only"""
+    with duckdb.connect() as con:
+        return [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {file_source(path)}").fetchall()]
+
+
+def scan_file(path, columns=None, kdsatker=None, kdbank=None, from_date=None, to_date=None,
+              date_column="tgl_transaksi", batch_rows=BATCH_ROWS):
+    """Yield DataFrames of at most `batch_rows` rows from `path`, filtered while reading.
+
+    `kdsatker` and `kdbank` are lists of allowed codes, `from_date`/`to_date`
+    an inclusive range on `date_column`.
+    """
+    where, params = where_clause({"kdsatker": kdsatker, "kdbank": kdbank})
+    day = f"TRY_CAST({quote_ident(date_column)} AS DATE)"
+    for op, value in ((">=", from_date), ("<=", to_date)):
+        if value:
+            where += f"{' AND' if where else ' WHERE'} {day} {op} CAST(? AS DATE)"
+            params.append(str(value))
+    select = ", ".join(quote_ident(col) for col in columns) if columns else "*"
+
+    with duckdb.connect() as con:
+        reader = con.execute(f"SELECT {select} FROM {file_source(path)}{where}", params).fetch_record_batch(batch_rows)
+        for batch in reader:
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+
+def import_file(path, dataset=None, store=None, on_batch=None, **filters):
+    """Load the filtered slice of `path` into the dataset store; returns (dataset, rows scanned, rows added).
+
+    Batches are appended as they are read and every month they touched is
+    de-duplicated once at the end, so re-importing an overlapping slice
+    replaces rows rather than stacking copies. Rows added is how many more
+    rows those months hold afterwards. A filter or column the file does not
+    have raises ValueError before anything is read.
+    """
+    store = store or DatasetStore()
+    dataset = check_dataset_name(dataset or os.path.splitext(os.path.basename(path))[0])
+    available = file_columns(path)
+    wanted = {"kdsatker": filters.get("kdsatker"), "kdbank": filters.get("kdbank"),
+              filters.get("date_column", "tgl_transaksi"): filters.get("from_date") or filters.get("to_date")}
+    missing = [col for col, value in wanted.items() if value and col not in available]
+    missing += [col for col in filters.get("columns") or [] if col not in available]
+    if missing:
+        raise ValueError(f"{os.path.basename(path)} has no column {', '.join(missing)}")
+    columns = filters.get("columns")
+    if columns and PARTITION_COLUMN not in columns and PARTITION_COLUMN in available:
+        # The store partitions on it, so keep it even when it was not asked for
+        filters["columns"] = [*columns, PARTITION_COLUMN]
+
+    before = store.catalog().get(dataset, {}).get("partitions", {})
+    rows = 0
+    for batch in scan_file(path, **filters):
+        store.write(dataset, batch, source=path)
+        rows += len(batch)
+        if on_batch:
+            on_batch(rows)
+    # Every write adds rows to the months it touches, so a changed count marks them
+    after = store.catalog().get(dataset, {}).get("partitions", {})
+    touched = [month for month, count in after.items() if count != before.get(month)]
+    stored = store.deduplicate(dataset, touched) if touched else 0
+    return dataset, rows, stored - sum(before.get(month, 0) for month in touched)
+
+
+def _codes(value):
+    return [code.strip() for code in value.split(",") if code.strip()] if value else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a slice of a large CSV/Parquet export into the dataset store")
+    parser.add_argument("path", help="CSV or Parquet file")
+    parser.add_argument("--dataset", help="dataset name (default: the file name)")
+    parser.add_argument("--columns", help="comma-separated columns to keep (default: all)")
+    parser.add_argument("--kdsatker", help="comma-separated kdsatker codes to keep")
+    parser.add_argument("--kdbank", help="comma-separated kdbank codes to keep")
+    parser.add_argument("--from", dest="from_date", help="first tgl_transaksi to keep (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="to_date", help="last tgl_transaksi to keep (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    dataset, rows, added = import_file(
+        args.path, args.dataset, columns=_codes(args.columns), kdsatker=_codes(args.kdsatker),
+        kdbank=_codes(args.kdbank), from_date=args.from_date, to_date=args.to_date,
+        on_batch=lambda rows: print(f"{rows} rows read...")
+    )
+    print(f"Read {rows} rows from {args.path}; {dataset} now holds {added} more rows")
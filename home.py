@@ -1,25 +1,173 @@
 import streamlit as st
 import requests
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import os
-import time
+import uuid
 from datetime import datetime, date, timedelta
-import json
+
+from coverage import ENTITY_COLUMNS, CoverageCache, CoverageIndex, date_column
+from data_grid import column_profile, show_data_grid
+from dataset_store import STORE_DIR, DatasetStore, check_dataset_name
+from downsample import bucket_series, downsample
+from export import FORMATS, frame_batches, show_exports, start_export
+from fetch_engine import EndpointRequest, FetchCancelled, check_cancelled, fetch_endpoint, new_progress
+from history_loader import IMPORT_DIR, file_columns, import_file, import_files, import_path
+from http_client import get_client
+from jobs import format_eta, get_job_manager
+from merge_engine import key_for, row_hashes, upsert
+from query_engine import QueryEngine
+from response_cache import ResponseCache
+from rollups import DAY_COLUMN, build_rollups, combine_all, top_groups
+from saldo_schema import apply_schema
+from scheduler import FetchScheduler
+from sharding import SHARD_UNITS
+from token_manager import TokenManager
 
 st.set_page_config(page_title="🔐 API Data Fetcher & Visualizer", layout="wide")
 
 # Initialize session state
 if "auth_token" not in st.session_state:
     st.session_state.auth_token = None
+if "token_manager" not in st.session_state:
+    st.session_state.token_manager = None
 if "form_fields" not in st.session_state:
     st.session_state.form_fields = [{"key": "", "value": ""}]
 if "fetched_data" not in st.session_state:
     st.session_state.fetched_data = {}
 if "endpoints" not in st.session_state:
     st.session_state.endpoints = []
+if "session_id" not in st.session_state:
+    # Jobs are shared by every browser session of the server; this tells ours apart
+    st.session_state.session_id = uuid.uuid4().hex
+if "rollups" not in st.session_state:
+    st.session_state.rollups = {}
+if "dataset_versions" not in st.session_state:
+    st.session_state.dataset_versions = {}
+if "export_jobs" not in st.session_state:
+    st.session_state.export_jobs = {}
+
+
+def collect_finished_jobs():
+    """Move the datasets of finished background fetches into this session"""
+    for job in get_job_manager().jobs(st.session_state.session_id):
+        if job.finished and job.result:
+            for name, df in job.take_result().items():
+                # Overlapping fetches are merged on the natural key instead of replacing each other
+                existing = st.session_state.fetched_data.get(name)
+                key = key_for(name, df.columns)
+                merged, stats = upsert(existing, df, key)
+                st.session_state.fetched_data[name] = merged
+                # Summarised once here, so the charts never aggregate the raw rows
+                previous = st.session_state.rollups.get(name)
+                if existing is None or previous is None or stats["updated"]:
+                    # A replaced row's min and max cannot be taken back out of a rollup
+                    st.session_state.rollups[name] = build_rollups(merged)
+                elif stats["inserted"]:
+                    # Only new keys came in (identical re-fetched rows change nothing): fold in just those
+                    added = merged[~np.isin(row_hashes(merged, key), row_hashes(existing, key))]
+                    if len(added) == stats["inserted"]:
+                        st.session_state.rollups[name] = combine_all([previous, build_rollups(added)])
+                    else:
+                        st.session_state.rollups[name] = build_rollups(merged)
+                st.session_state.dataset_versions[name] = job.id
+            if st.session_state.token_manager:
+                # The job may have renewed the token on its way
+                st.session_state.auth_token = st.session_state.token_manager.token
+
+
+@st.fragment(run_every=2)
+def show_fetch_jobs():
+    """Live progress of the background fetches; refreshes on its own without rerunning the page"""
+    collect_finished_jobs()
+    jobs = get_job_manager().jobs(st.session_state.session_id)
+    if not jobs:
+        return
+    
+    st.markdown("### 🧵 Background Jobs")
+    rate_limiter = get_client().rate_limiter
+    st.caption(f"⚡ Current request rate: {rate_limiter.rate:.1f} req/s · throttled responses so far: {rate_limiter.throttled}")
+    
+    for job in jobs:
+        totals = job.totals()
+        with st.container(border=True):
+            st.markdown(f"**{job.name}** — {job.status}")
+            if totals["total_pages"]:
+                st.progress(min(1.0, totals["pages"] / totals["total_pages"]))
+            
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Pages", f"{totals['pages']}/{totals['total_pages'] or '?'}")
+            col2.metric("Rows", totals["records"])
+            col3.metric("Pages/sec", f"{job.pages_per_second():.1f}")
+            col4.metric("ETA", format_eta(job.eta_seconds()))
+            
+            with st.expander("Endpoints"):
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            "Endpoint": endpoint.split('/')[-1] or endpoint,
+                            "Status": p["status"],
+                            "Pages": f"{p['pages']}/{p['total_pages'] or '?'}",
+                            "Records": p["records"],
+                            "Resumed pages": p["resumed"],
+                        }
+                        for endpoint, p in list(job.progress.items())
+                    ]),
+                    use_container_width=True
+                )
+            
+            for level, text in list(job.messages):
+                getattr(st, level)(text)
+            if job.error:
+                st.error(f"❌ Job failed: {job.error}")
+            
+            if job.finished:
+                st.button("🗑️ Dismiss", key=f"dismiss_{job.id}", on_click=get_job_manager().forget, args=(job.id,))
+            else:
+                st.button("⏹️ Cancel", key=f"cancel_{job.id}", on_click=job.cancel, disabled=job.cancelled)
+
+
+collect_finished_jobs()
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_stored_rollups(dataset, months, updated_at):
+    """The rollups of some months of a stored dataset, merged; `updated_at` makes new writes invalidate the cache"""
+    return DatasetStore().rollups(dataset, months=list(months))
+
+
+def get_query_engine():
+    """This session's DuckDB engine; the selected dataset is registered in it as table "dataset" """
+    if "query_engine" not in st.session_state:
+        st.session_state.query_engine = QueryEngine()
+    return st.session_state.query_engine
+
+
+def get_coverage_cache():
+    """This session's coverage indexes, so reruns do not parse every date again"""
+    if "coverage_cache" not in st.session_state:
+        st.session_state.coverage_cache = CoverageCache()
+    return st.session_state.coverage_cache
+
+
+def histogram_figure(bins, column, title):
+    """Bars for the bins computed by QueryEngine.histogram()"""
+    fig = go.Figure(go.Bar(x=(bins['start'] + bins['end']) / 2, y=bins['count'],
+                           width=bins['end'] - bins['start'], name=column))
+    fig.update_layout(title=title, xaxis_title=column, yaxis_title='count', bargap=0)
+    return fig
+
+
+def box_figure(stats, column, title):
+    """A box plot drawn from the statistics of QueryEngine.box_stats(), without the points themselves"""
+    fig = go.Figure(go.Box(name=column, q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+                           mean=[stats['mean']], lowerfence=[stats['lowerfence']],
+                           upperfence=[stats['upperfence']]))
+    fig.update_layout(title=title)
+    return fig
+
 
 st.title("🔐 API Data Fetcher & Visualizer")
 
@@ -40,6 +188,10 @@ if menu == "Login":
         if st.session_state.auth_token:
             st.success("✅ Already logged in!")
             st.code(st.session_state.auth_token[:50] + "...", language="text")
+            token_manager = st.session_state.token_manager
+            if token_manager and token_manager.expires_at:
+                expires = datetime.fromtimestamp(token_manager.expires_at).strftime("%Y-%m-%d %H:%M:%S")
+                st.caption(f"⏰ Token expires {expires} — it is renewed automatically during fetches")
         else:
             st.info("Please login to continue")
 
@@ -60,6 +212,10 @@ if menu == "Login":
                     if data.get("status") == "MSG20004":
                         st.success(f"✅ {data.get('message', 'Login success')}")
                         st.session_state.auth_token = data.get("token")
+                        # Keeps the credentials so long fetches can log in again when the token expires
+                        st.session_state.token_manager = TokenManager(
+                            data.get("token"), auth_url=api_url, username=username, password=password
+                        )
                         st.rerun()
                     else:
                         st.warning("⚠️ Login response not in expected format.")
@@ -203,200 +359,253 @@ elif menu == "Fetch Data":
     col1, col2 = st.columns(2)
     with col1:
         max_pages = st.number_input("Max pages per endpoint", min_value=1, max_value=1000, value=100)
-        delay_seconds = st.number_input("Delay between requests (seconds)", min_value=0.1, max_value=10.0, value=1.0)
+        max_rate = st.number_input("Max requests per second", min_value=0.5, max_value=100.0, value=20.0,
+                                   help="Upper bound for this fetch; the shared adaptive limiter still backs off when the server throttles")
+        concurrency = st.number_input("Concurrent requests per endpoint", min_value=1, max_value=32, value=4,
+                                      help="Pages after the first are fetched in parallel; 1 fetches them one by one")
     
     with col2:
-        save_csv = st.checkbox("💾 Save to CSV files", value=True)
-        csv_folder = st.text_input("CSV folder name", value="fetched_data")
+        save_to_store = st.checkbox("💾 Save to dataset store", value=True,
+                                    help=f"Parquet files in {STORE_DIR}/, partitioned by tgl_transaksi month")
+        resume = st.checkbox("♻️ Resume interrupted fetches", value=True,
+                             help="Keep finished pages on disk and only fetch the missing ones on the next run; "
+                                  "checkpoints older than a day start over")
+        use_cache = st.checkbox("⚡ Use response cache", value=False,
+                                help="Reuse pages fetched earlier with the same endpoint and parameters")
+        cache_ttl_minutes = st.number_input("Cache lifetime (minutes)", min_value=1, max_value=24 * 60, value=60,
+                                            disabled=not use_cache)
+        parallel_endpoints = st.number_input("Endpoints fetched in parallel", min_value=1, max_value=32, value=4)
+        max_requests = st.number_input("Max requests in flight (all endpoints)", min_value=1, max_value=64, value=8)
+        per_host = st.number_input("Max requests in flight per host", min_value=1, max_value=64, value=4)
+    
+    with st.expander("🧩 Date-range sharding"):
+        shard_unit = st.selectbox("Split the date range into", ["none"] + SHARD_UNITS,
+                                  help="Each window is fetched in parallel with its own shallow pagination")
+        shard_workers = st.number_input("Date windows fetched in parallel", min_value=1, max_value=32, value=4)
+        dense_rows = st.number_input("Split windows further above (rows)", min_value=100, max_value=1000000, value=5000)
     
     # Start fetching
     if st.button("🚀 Start Fetching All Data", type="primary"):
         
-        def fetch_all_pages(endpoint_url, form_data, headers, max_pages=100):
-            """Fetch all pages from an endpoint"""
-            all_data = []
-            current_page = 0
-            
-            while current_page <= max_pages:
-                try:
-                    # Update page in form data
-                    current_form_data = form_data.copy()
-                    current_form_data['page'] = str(current_page)
-                    
-                    response = requests.post(endpoint_url, headers=headers, data=current_form_data)
-                    
-                    if response.status_code == 200:
-                        try:
-                            data = response.json()
-                            
-                            if isinstance(data, dict) and "data" in data:
-                                if "datas" in data["data"]:
-                                    page_data = data["data"]["datas"]
-                                    if not page_data:  # No more data
-                                        break
-                                    
-                                    all_data.extend(page_data)
-                                    
-                                    # Check if we have more pages
-                                    total = int(data["data"].get("total", 0))
-                                    page_size = int(data["data"].get("size", 20))
-                                    total_pages = (total + page_size - 1) // page_size
-                                    
-                                    if current_page >= total_pages:
-                                        break
-                                        
-                                else:
-                                    break
-                            else:
-                                break
-                                
-                        except ValueError:
-                            break
-                    else:
-                        break
-                    
-                    current_page += 1
-                    time.sleep(delay_seconds)
-                    
-                except Exception as e:
-                    st.error(f"Error on page {current_page}: {e}")
-                    break
-            
-            return all_data
+        # The rate cap belongs to this fetch; the shared limiter still backs off for every session
+        scheduler = FetchScheduler(max_endpoints=parallel_endpoints, max_requests=max_requests, per_host=per_host,
+                                   max_rate=max_rate)
+        response_cache = ResponseCache(ttl_seconds=cache_ttl_minutes * 60) if use_cache else None
         
         # Prepare request data
         form_data = {f["key"]: f["value"] for f in st.session_state.form_fields if f["key"]}
         
-        headers = {"Authorization": f"Bearer {st.session_state.auth_token}"}
-        
-        # Create CSV folder
-        if save_csv and not os.path.exists(csv_folder):
-            os.makedirs(csv_folder)
+        # Authorization is added to every request by the token manager, which renews it when needed
+        token_manager = st.session_state.token_manager or TokenManager(st.session_state.auth_token)
         
-        # Progress tracking
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        store = DatasetStore() if save_to_store else None
         
-        total_endpoints = len(st.session_state.endpoints)
+        endpoints = list(st.session_state.endpoints)
         
-        for idx, endpoint in enumerate(st.session_state.endpoints):
-            status_text.text(f"Fetching from endpoint {idx + 1}/{total_endpoints}: {endpoint}")
+        def run_fetch(job):
+            """Fetch every endpoint on a job thread; returns {dataset name: DataFrame}.
             
-            try:
-                # Fetch all pages for this endpoint
-                endpoint_data = fetch_all_pages(endpoint, form_data, headers, max_pages)
+            Nothing in here may call st.*: progress and messages go through `job`.
+            """
+            for endpoint in endpoints:
+                job.progress[endpoint] = new_progress()
+            results = {}
+            
+            def run_endpoint(endpoint):
+                """Fetch one endpoint on a scheduler thread and return (records, checkpoints to clear once saved)"""
+                request = EndpointRequest(endpoint, form_data, auth=token_manager, cache=response_cache, scheduler=scheduler)
+                return fetch_endpoint(
+                    request, first_page=0, max_pages=max_pages, concurrency=concurrency, resume=resume,
+                    shard_unit=None if shard_unit == "none" else shard_unit, from_date=from_date, to_date=to_date,
+                    shard_workers=shard_workers, dense_threshold=dense_rows,
+                    progress=job.progress[endpoint], partial_ok=True, cancel=job.cancel_event
+                )
+            
+            for endpoint, result, error in scheduler.run(endpoints, run_endpoint):
+                endpoint_data, checkpoints = result or ([], [])
+                idx = endpoints.index(endpoint)
+                progress = job.progress[endpoint]
                 
-                if endpoint_data:
-                    # Create DataFrame
-                    df = pd.DataFrame(endpoint_data)
-                    
-                    # Store in session state
-                    endpoint_name = endpoint.split('/')[-1] or f"endpoint_{idx + 1}"
-                    st.session_state.fetched_data[endpoint_name] = df
-                    
-                    # Save to CSV
-                    if save_csv:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        csv_filename = f"{csv_folder}/{endpoint_name}_{timestamp}.csv"
-                        df.to_csv(csv_filename, index=False)
-                    
-                    st.success(f"✅ {endpoint_name}: {len(endpoint_data)} records fetched")
+                if isinstance(error, FetchCancelled):
+                    progress["status"] = "cancelled"
+                elif error is not None:
+                    progress["status"] = "failed"
+                    job.log("error", f"❌ Error fetching {endpoint}: {error}")
                 else:
-                    st.warning(f"⚠️ No data found for: {endpoint}")
-                    
-            except Exception as e:
-                st.error(f"❌ Error fetching {endpoint}: {e}")
+                    progress["status"] = "done"
+                    try:
+                        if progress["error"]:
+                            job.log("warning", f"⚠️ {endpoint}: {progress['error']} (kept {len(endpoint_data)} records fetched before it)")
+                        
+                        if endpoint_data:
+                            # Create DataFrame, with saldo columns in their compact types
+                            df = apply_schema(pd.DataFrame(endpoint_data))
+                            endpoint_name = endpoint.split('/')[-1] or f"endpoint_{idx + 1}"
+                            results[endpoint_name] = df
+                            
+                            # Merge into the dataset store: re-fetched rows replace their older copies
+                            if store:
+                                store.upsert(endpoint_name, df, source=endpoint)
+                            
+                            job.log("success", f"✅ {endpoint_name}: {len(endpoint_data)} records fetched")
+                        else:
+                            job.log("warning", f"⚠️ No data found for: {endpoint}")
+                        
+                        # Finished pages are only needed again if this fetch stopped early
+                        if not progress["error"]:
+                            for checkpoint in checkpoints:
+                                checkpoint.clear()
+                            
+                    except Exception as e:
+                        job.log("error", f"❌ Error saving {endpoint}: {e}")
             
-            # Update progress
-            progress_bar.progress((idx + 1) / total_endpoints)
+            if token_manager.refreshes:
+                job.log("caption", f"🔑 Token renewed {token_manager.refreshes} time(s) during the fetch")
+            if response_cache:
+                job.log("caption", f"⚡ Response cache: {response_cache.hits} hits, {response_cache.misses} misses")
+            return results
         
-        status_text.text("✅ All endpoints processed!")
-        st.balloons()
+        # The fetch runs in the background, so it survives reruns and leaving this page
+        get_job_manager().submit(f"{len(endpoints)} endpoints, {from_date_str} to {to_date_str}", run_fetch,
+                                 owner=st.session_state.session_id)
+    
+    show_fetch_jobs()
 
 # --- VISUALIZE DATA PAGE ---
 elif menu == "Visualize Data":
     st.subheader("📊 Data Visualization")
     
-    if not st.session_state.fetched_data:
+    with st.expander("📥 Import History File"):
+        st.caption("Stream a large CSV or Parquet export into the dataset store, keeping only the slice you need")
+        # Only files an admin put in the import folder can be read, never an arbitrary server path
+        history_file = st.selectbox("File", import_files(), index=None,
+                                    placeholder=f"CSV or Parquet files in {IMPORT_DIR}/ on the server")
+        if history_file:
+            history_path = import_path(history_file)
+            try:
+                available = file_columns(history_path)
+            except Exception as e:
+                st.error(f"❌ Cannot read {history_file}: {e}")
+                available = None
+        if history_file and available is not None:
+            col1, col2 = st.columns(2)
+            with col1:
+                history_dataset = st.text_input("Dataset name", value=os.path.splitext(os.path.basename(history_file))[0])
+                history_columns = st.multiselect("Columns (all when empty)", available)
+                # Filters are only offered for the columns the file has
+                history_satkers = st.text_input("kdsatker (comma-separated, all when empty)") if "kdsatker" in available else ""
+                history_banks = st.text_input("kdbank (comma-separated, all when empty)") if "kdbank" in available else ""
+            with col2:
+                has_dates = "tgl_transaksi" in available
+                history_from = st.date_input("From tgl_transaksi", value=None) if has_dates else None
+                history_to = st.date_input("To tgl_transaksi", value=None) if has_dates else None
+            
+            if st.button("📥 Import"):
+                try:
+                    check_dataset_name(history_dataset)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    history_filters = dict(
+                        columns=history_columns or None,
+                        kdsatker=[c.strip() for c in history_satkers.split(",") if c.strip()] or None,
+                        kdbank=[c.strip() for c in history_banks.split(",") if c.strip()] or None,
+                        from_date=history_from, to_date=history_to
+                    )
+                    
+                    def run_import(job):
+                        """Import on a job thread, like a fetch; nothing in here may call st.*"""
+                        progress = job.progress[history_file] = new_progress()
+                        progress["status"] = "running"
+                        
+                        def on_batch(rows):
+                            check_cancelled(job.cancel_event)
+                            progress["pages"] += 1
+                            progress["records"] = rows
+                        
+                        try:
+                            dataset, rows, added = import_file(history_path, history_dataset, on_batch=on_batch,
+                                                               **history_filters)
+                        except BaseException as e:
+                            progress["status"] = "cancelled" if isinstance(e, FetchCancelled) else "failed"
+                            raise
+                        progress["status"] = "done"
+                        job.log("success", f"✅ Imported {rows:,} rows into {dataset}: {added:,} new, "
+                                           f"{rows - added:,} already stored or duplicated")
+                    
+                    get_job_manager().submit(f"Import {history_file}", run_import, owner=st.session_state.session_id)
+    
+    show_fetch_jobs()
+    
+    stored_datasets = DatasetStore().catalog()
+    if not st.session_state.fetched_data and not stored_datasets:
         st.error("❌ No data available. Please fetch data first!")
         st.stop()
     
-    # Dataset selection
+    # Dataset selection: this session's fetches first, then everything in the dataset store
     dataset_names = list(st.session_state.fetched_data.keys())
+    dataset_names += [name for name in sorted(stored_datasets) if name not in dataset_names]
     selected_dataset = st.selectbox("📋 Select Dataset", dataset_names)
     
-    if selected_dataset:
+    # Charts get their aggregates from the query engine instead of recomputing them in pandas
+    engine = get_query_engine()
+    if selected_dataset in st.session_state.fetched_data:
         df = st.session_state.fetched_data[selected_dataset]
+        engine.register_frame("dataset", df)
+        if selected_dataset not in st.session_state.rollups:
+            st.session_state.rollups[selected_dataset] = build_rollups(df)
+        rollups = st.session_state.rollups[selected_dataset]
+        data_version = (selected_dataset, st.session_state.dataset_versions.get(selected_dataset))
+        # Columns and types come from the frame itself
+        schema = df
+        total_rows = len(df)
+        size_metric = ("💾 Memory Usage", f"{df.memory_usage(deep=True).sum() / 1024:.1f} KB")
+    elif selected_dataset:
+        store = DatasetStore()
+        entry = stored_datasets[selected_dataset]
+        months = sorted(entry["partitions"])
+        # Only the chosen month partitions are read from disk
+        selected_months = st.multiselect("🗓️ Months", months, default=months[-12:],
+                                         help=f"{entry['rows']:,} rows in {len(months)} months, updated {entry.get('updated_at')}")
+        if not selected_months:
+            st.info("ℹ️ Select at least one month to visualize.")
+            st.stop()
+        # The rows stay on disk: DuckDB scans the Parquet files itself, reading only the columns a chart needs,
+        # and the counts come from the catalog
+        df = None
+        engine.register_dataset(selected_dataset, selected_months, name="dataset")
+        rollups = load_stored_rollups(selected_dataset, tuple(selected_months), entry.get("updated_at"))
+        data_version = (selected_dataset, tuple(selected_months), entry.get("updated_at"))
+        schema = store.empty_frame(selected_dataset, selected_months)
+        total_rows = sum(entry["partitions"][month] for month in selected_months)
+        size_metric = ("💾 Size on Disk", f"{store.size(selected_dataset, selected_months) / 1024:.1f} KB")
+    
+    if selected_dataset:
         
-        # Calculate transaction coverage for this specific endpoint
+        # Transaction coverage for this endpoint, reparsed only when its data changed
+        date_col = date_column(schema)
         transaction_coverage = {}
-        date_col = None
-        for col in df.columns:
-            if 'tgl_transaksi' in col.lower():
-                date_col = col
-                break
-        
         if date_col:
             try:
-                # Convert to datetime
-                df_temp = df.copy()
-                df_temp[f'{date_col}_dt'] = pd.to_datetime(df_temp[date_col], errors='coerce')
-                
-                # Remove null dates
-                valid_dates = df_temp[f'{date_col}_dt'].dropna()
-                
-                if len(valid_dates) > 0:
-                    # Get unique transaction days
-                    unique_days = valid_dates.dt.date.nunique()
-                    
-                    # Calculate coverage percentage (based on 365 days)
-                    year_coverage = (unique_days / 365) * 100
-                    
-                    # Get date range
-                    min_date = valid_dates.min().date()
-                    max_date = valid_dates.max().date()
-                    date_range_days = (max_date - min_date).days + 1
-                    
-                    # Coverage within actual date range
-                    range_coverage = (unique_days / date_range_days) * 100 if date_range_days > 0 else 0
-                    
-                    transaction_coverage = {
-                        'unique_days': unique_days,
-                        'year_coverage': year_coverage,
-                        'range_coverage': range_coverage,
-                        'min_date': min_date,
-                        'max_date': max_date,
-                        'date_range_days': date_range_days
-                    }
+                if df is not None:
+                    transaction_coverage = get_coverage_cache().coverage(selected_dataset, df)
                 else:
-                    transaction_coverage = {
-                        'unique_days': 0,
-                        'year_coverage': 0,
-                        'range_coverage': 0,
-                        'min_date': None,
-                        'max_date': None,
-                        'date_range_days': 0
-                    }
+                    # Only the distinct days leave DuckDB
+                    transaction_coverage = get_coverage_cache().coverage_of_days(
+                        selected_dataset, data_version, lambda: engine.counts_by_date("dataset", date_col)["date"])
             except Exception as e:
                 st.warning(f"⚠️ Error calculating coverage: {e}")
-                transaction_coverage = {
-                    'unique_days': 0,
-                    'year_coverage': 0,
-                    'range_coverage': 0,
-                    'min_date': None,
-                    'max_date': None,
-                    'date_range_days': 0
-                }
+                transaction_coverage = CoverageIndex().summary()
         
         # Display basic info with transaction coverage
         if date_col and transaction_coverage:
             col1, col2, col3, col4, col5, col6 = st.columns(6)
             with col1:
-                st.metric("📊 Total Records", len(df))
+                st.metric("📊 Total Records", total_rows)
             with col2:
-                st.metric("📋 Total Columns", len(df.columns))
+                st.metric("📋 Total Columns", len(schema.columns))
             with col3:
-                st.metric("💾 Memory Usage", f"{df.memory_usage(deep=True).sum() / 1024:.1f} KB")
+                st.metric(*size_metric)
             with col4:
                 st.metric("📅 Unique Transaction Days", transaction_coverage['unique_days'])
             with col5:
@@ -427,81 +636,127 @@ elif menu == "Visualize Data":
                 st.warning(f"🟠 Moderate transaction coverage. This endpoint has transactions on {transaction_coverage['unique_days']} unique days ({year_cov:.1f}% of year)")
             else:
                 st.error(f"🔴 Low transaction coverage. This endpoint has transactions on {transaction_coverage['unique_days']} unique days ({year_cov:.1f}% of year)")
-        
+
+            entity_cols = [col for col in ENTITY_COLUMNS if col in schema.columns]
+            if entity_cols:
+                with st.expander("🧩 Coverage per Satker / Account"):
+                    entity = st.selectbox("Coverage per", entity_cols)
+                    if df is not None:
+                        matrix = get_coverage_cache().matrix(selected_dataset, df, entity)
+                    else:
+                        matrix = get_coverage_cache().matrix_of_pairs(
+                            selected_dataset, data_version, entity,
+                            lambda: engine.entity_days("dataset", entity, date_col))
+                    per_entity = matrix.entity_coverage().sort_values("coverage", ignore_index=True)
+
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.markdown(f"**Least covered {entity}** ({len(per_entity):,} in total)")
+                        st.dataframe(per_entity, height=300)
+                    with col2:
+                        min_gap = st.number_input("Shortest gap to list (days)", min_value=1, value=7)
+                        gaps = matrix.gaps(min_gap)
+                        st.markdown(f"**{len(gaps):,} gaps** of {min_gap}+ days without transactions")
+                        st.dataframe(gaps.head(1000), height=300)
+
+                    daily = matrix.daily()
+                    fig = px.area(downsample(daily, 'date', 'share'), x='date', y='share',
+                                  title=f'Share of {entity} with transactions per day')
+                    st.plotly_chart(fig, use_container_width=True)
+
+                    # Only the least covered rows; a heatmap of thousands of rows is unreadable
+                    shown = st.slider("Rows in heatmap", 10, 200, 50)
+                    monthly = matrix.monthly().loc[per_entity[entity].head(shown)]
+                    fig = px.imshow(monthly, aspect='auto', color_continuous_scale='RdYlGn', zmin=0, zmax=100,
+                                    labels={'x': 'Month', 'y': entity, 'color': 'Coverage %'},
+                                    title=f'Monthly coverage of the {len(monthly)} least covered {entity}')
+                    fig.update_layout(height=max(400, 14 * len(monthly)))
+                    st.plotly_chart(fig, use_container_width=True)
+
         else:
             # Default display when no transaction date column
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("📊 Total Records", len(df))
+                st.metric("📊 Total Records", total_rows)
             with col2:
-                st.metric("📋 Total Columns", len(df.columns))
+                st.metric("📋 Total Columns", len(schema.columns))
             with col3:
-                st.metric("💾 Memory Usage", f"{df.memory_usage(deep=True).sum() / 1024:.1f} KB")
+                st.metric(*size_metric)
             
             if not date_col:
                 st.info("ℹ️ No 'tgl_transaksi' column found. Transaction coverage analysis not available for this endpoint.")
         
         # Data preview
         with st.expander("🔍 Data Preview"):
-            st.dataframe(df.head(10))
+            # One page at a time, sorted and searched inside the query engine
+            show_data_grid(engine, "dataset", key="preview")
         
-        # Column analysis
+        # Column analysis, profiled once per version of the dataset
         with st.expander("📈 Column Information"):
-            col_info = pd.DataFrame({
-                'Column': df.columns,
-                'Type': df.dtypes,
-                'Non-Null Count': df.count(),
-                'Null Count': df.isnull().sum(),
-                'Unique Values': df.nunique()
-            })
-            st.dataframe(col_info)
+            st.dataframe(column_profile(engine, "dataset", data_version))
         
         # Visualizations
         st.markdown("### 📊 Visualizations")
         
         # Numeric columns for analysis
-        numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
-        categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+        # is_numeric_dtype also knows the decimal[pyarrow] amounts that select_dtypes('number') skips
+        numeric_cols = [col for col in schema.columns if pd.api.types.is_numeric_dtype(schema[col])
+                        and not pd.api.types.is_bool_dtype(schema[col])]
+        categorical_cols = schema.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
+        
+        # Filters run inside the query engine too, so only the filtered aggregates come back
+        filters = {}
+        with st.expander("🔎 Filter Charts"):
+            for col in st.multiselect("Filter on columns", categorical_cols):
+                options = engine.value_counts("dataset", col, n=500)["value"].astype(str).tolist()
+                filters[col] = st.multiselect(f"{col} values", options, key=f"filter_{col}")
+            if any(filters.values()):
+                st.caption(f"{engine.count('dataset', filters):,} of {engine.count('dataset'):,} rows match")
+        # The rollups summarise all rows; filtered charts have to go back to the rows in the engine
+        chart_rollups = {} if any(filters.values()) else rollups
         
         if numeric_cols:
-            # Saldo analysis (if available)
-            if 'saldo_akhir' in df.columns:
+            # Saldo analysis (saldo_akhir is numeric once the schema is applied at ingest)
+            if 'saldo_akhir' in numeric_cols:
                 st.markdown("#### 💰 Saldo Analysis")
                 
-                # Convert to numeric
-                df['saldo_akhir_numeric'] = pd.to_numeric(df['saldo_akhir'], errors='coerce')
-                
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                    # Top 10 highest saldo
-                    top_saldo = df.nlargest(10, 'saldo_akhir_numeric')
-                    if 'nmsatker' in df.columns:
-                        fig = px.bar(top_saldo, x='saldo_akhir_numeric', y='nmsatker', 
+                    # Top 10 rows by saldo; DuckDB keeps only those ten (ORDER BY ... LIMIT), on stored partitions too
+                    top_saldo = engine.top_n("dataset", "saldo_akhir", 10, filters)
+                    if 'nmsatker' in schema.columns:
+                        fig = px.bar(top_saldo, x='saldo_akhir', y='nmsatker', 
                                    title='Top 10 Highest Saldo', orientation='h')
                     else:
-                        fig = px.bar(top_saldo, x='saldo_akhir_numeric', 
+                        fig = px.bar(top_saldo, x='saldo_akhir', 
                                    title='Top 10 Highest Saldo')
                     fig.update_layout(height=500)
                     st.plotly_chart(fig, use_container_width=True)
                 
                 with col2:
                     # Saldo distribution
-                    fig = px.histogram(df, x='saldo_akhir_numeric', 
-                                     title='Saldo Distribution', nbins=30)
+                    # Binned by the engine; only the 30 bars reach the browser
+                    fig = histogram_figure(engine.histogram("dataset", "saldo_akhir", 30, filters),
+                                           'saldo_akhir', 'Saldo Distribution')
                     fig.update_layout(height=500)
                     st.plotly_chart(fig, use_container_width=True)
                 
                 # Bank analysis
-                if 'kdbank' in df.columns:
+                if 'kdbank' in schema.columns:
                     st.markdown("#### 🏦 Bank Analysis")
                     
-                    bank_summary = df.groupby('kdbank').agg({
-                        'saldo_akhir_numeric': ['count', 'sum', 'mean']
-                    }).round(2)
-                    
-                    bank_summary.columns = ['Count', 'Total Saldo', 'Average Saldo']
-                    bank_summary = bank_summary.reset_index()
+                    if 'kdbank' in chart_rollups:
+                        bank = chart_rollups['kdbank'].sort_values('count', ascending=False)
+                        bank_summary = pd.DataFrame({
+                            'kdbank': bank['kdbank'],
+                            'Count': bank['count'],
+                            'Total Saldo': bank['total'],
+                            'Average Saldo': (bank['total'].astype('Float64') / bank['count']).round(2)
+                        })
+                    else:
+                        bank_summary = engine.group_summary("dataset", "kdbank", "saldo_akhir", filters).round(2)
+                        bank_summary.columns = ['kdbank', 'Count', 'Total Saldo', 'Average Saldo']
                     
                     col1, col2 = st.columns(2)
                     
@@ -525,11 +780,15 @@ elif menu == "Visualize Data":
                     col1, col2 = st.columns(2)
                     
                     with col1:
-                        fig = px.box(df, y=selected_numeric, title=f'{selected_numeric} Box Plot')
-                        st.plotly_chart(fig, use_container_width=True)
+                        stats = engine.box_stats("dataset", selected_numeric, filters)
+                        if stats['n']:
+                            fig = box_figure(stats, selected_numeric, f'{selected_numeric} Box Plot')
+                            st.plotly_chart(fig, use_container_width=True)
+                            st.caption(f"{int(stats['outliers']):,} of {int(stats['n']):,} values lie beyond the whiskers")
                     
                     with col2:
-                        fig = px.histogram(df, x=selected_numeric, title=f'{selected_numeric} Distribution')
+                        fig = histogram_figure(engine.histogram("dataset", selected_numeric, 50, filters),
+                                               selected_numeric, f'{selected_numeric} Distribution')
                         st.plotly_chart(fig, use_container_width=True)
         
         # Categorical analysis
@@ -539,50 +798,60 @@ elif menu == "Visualize Data":
             selected_categorical = st.selectbox("Select categorical column", categorical_cols)
             
             if selected_categorical:
-                value_counts = df[selected_categorical].value_counts().head(15)
+                rollup = next((chart_rollups[name] for name in ('kdbank', 'kdsatker')
+                               if name in chart_rollups and selected_categorical in chart_rollups[name]), None)
+                if rollup is not None:
+                    value_counts = top_groups(rollup, selected_categorical, 15)
+                else:
+                    value_counts = engine.value_counts("dataset", selected_categorical, 15, filters)
                 
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                    fig = px.bar(x=value_counts.index, y=value_counts.values,
+                    fig = px.bar(x=value_counts["value"], y=value_counts["count"],
                                title=f'Top 15 {selected_categorical}')
                     fig.update_layout(xaxis_tickangle=-45)
                     st.plotly_chart(fig, use_container_width=True)
                 
                 with col2:
-                    fig = px.pie(values=value_counts.values, names=value_counts.index,
+                    fig = px.pie(values=value_counts["count"], names=value_counts["value"],
                                title=f'{selected_categorical} Distribution')
                     st.plotly_chart(fig, use_container_width=True)
         
         # Time series analysis (if date columns exist)
-        date_cols = [col for col in df.columns if 'tgl' in col.lower() or 'date' in col.lower()]
+        date_cols = [col for col in schema.columns if 'tgl' in col.lower() or 'date' in col.lower()]
         if date_cols:
             st.markdown("#### 📅 Time Series Analysis")
             
             selected_date_col = st.selectbox("Select date column", date_cols)
             
             if selected_date_col:
-                # Convert to datetime
-                df[f'{selected_date_col}_dt'] = pd.to_datetime(df[selected_date_col], errors='coerce')
-                
                 # Group by date
-                date_counts = df.groupby(df[f'{selected_date_col}_dt'].dt.date).size().reset_index()
-                date_counts.columns = ['date', 'count']
+                if selected_date_col == DAY_COLUMN and 'day' in chart_rollups:
+                    date_counts = chart_rollups['day'][['day', 'rows']].set_axis(['date', 'count'], axis=1)
+                else:
+                    date_counts = engine.counts_by_date("dataset", selected_date_col, filters)
                 
+                # Counts add up, so a long history is shown per week or month instead of per day
+                date_counts, bucket = bucket_series(date_counts, 'date', 'count')
                 fig = px.line(date_counts, x='date', y='count',
-                            title=f'Records by {selected_date_col}')
+                            title=f'Records per {bucket} by {selected_date_col}')
                 st.plotly_chart(fig, use_container_width=True)
         
         # Download processed data
         st.markdown("### 💾 Download Data")
         
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="📥 Download as CSV",
-            data=csv,
-            file_name=f"{selected_dataset}_processed.csv",
-            mime="text/csv"
-        )
+        # Written in batches to a temporary file in the background, then offered for download
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            export_format = st.selectbox("Format", list(FORMATS), format_func=lambda fmt: FORMATS[fmt][0])
+        with col2:
+            if st.button("📦 Prepare Download"):
+                batches = frame_batches(df) if df is not None else store.batches(selected_dataset, selected_months)
+                job = start_export(selected_dataset, batches, export_format, total_rows)
+                file_name = f"{selected_dataset}_processed{FORMATS[export_format][1]}"
+                st.session_state.export_jobs[job.id] = (file_name, export_format)
+        show_exports()
 
 # Sidebar info
 with st.sidebar:
@@ -604,24 +873,12 @@ with st.sidebar:
         # Quick coverage summary in sidebar
         coverage_summary = []
         for dataset_name, df in st.session_state.fetched_data.items():
-            date_col = None
-            for col in df.columns:
-                if 'tgl_transaksi' in col.lower():
-                    date_col = col
-                    break
-            
-            if date_col:
-                try:
-                    df_temp = df.copy()
-                    df_temp[f'{date_col}_dt'] = pd.to_datetime(df_temp[date_col], errors='coerce')
-                    valid_dates = df_temp[f'{date_col}_dt'].dropna()
-                    
-                    if len(valid_dates) > 0:
-                        unique_days = valid_dates.dt.date.nunique()
-                        coverage_percentage = (unique_days / 365) * 100
-                        coverage_summary.append(coverage_percentage)
-                except:
-                    pass
+            try:
+                coverage = get_coverage_cache().coverage(dataset_name, df)
+            except Exception:
+                continue
+            if coverage and coverage['unique_days']:
+                coverage_summary.append(coverage['year_coverage'])
         
         if coverage_summary:
             avg_coverage = sum(coverage_summary) / len(coverage_summary)
@@ -636,5 +893,8 @@ with st.sidebar:
     if st.button("🔄 Clear All Data"):
         st.session_state.fetched_data = {}
         st.session_state.endpoints = []
+        st.session_state.rollups = {}
+        st.session_state.dataset_versions = {}
+        get_coverage_cache().forget()
         st.success("✅ All data cleared!")
         st.rerun()
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import AdaptiveRateLimiter
+from response_cache import build_response
+
+# Responses worth another try: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """Pooled HTTP client shared by every fetch path.
+
+    Keeps connections alive through one `requests.Session`, applies separate
+    connect/read timeouts and retries connection errors, timeouts and
+    RETRY_STATUSES with jittered exponential backoff, honoring `Retry-After`.
+    When a `rate_limiter` is given every attempt waits for it and reports
+    its outcome back, so all workers share one adaptive request rate.
+    """
+
+    def __init__(self, pool_size=32, connect_timeout=10, read_timeout=60,
+                 max_retries=5, backoff_base=0.5, backoff_max=30, headers=None, rate_limiter=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+
+        self.session = requests.Session()
+        # Retries are handled in request() so they can honor Retry-After and feed the rate limiter
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def _backoff_seconds(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt + 1`"""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        # "Full jitter": a random wait up to the exponential ceiling
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, cache=None, **kwargs):
+        """Send a request, retrying transient failures. Returns the final response.
+
+        With a ResponseCache as `cache`, fresh entries are returned without a
+        request, stale ones are revalidated and new 200 responses are stored.
+        Pass `retry_read_timeouts=False` when the caller would rather react to
+        a slow response itself, e.g. by asking for a smaller page. With a
+        TokenManager as `auth`, a 401 triggers one re-login and a retry.
+        """
+        if cache is None:
+            return self._send(method, url, **kwargs)
+
+        identity_headers = dict(kwargs.get("headers") or {})
+        if hasattr(kwargs.get("auth"), "authorization"):
+            identity_headers.update(kwargs["auth"].authorization())
+        key = cache.key(method, url, kwargs.get("params"), kwargs.get("data"), kwargs.get("json"), identity_headers)
+        entry = cache.get(key)
+        if entry is not None and cache.is_fresh(entry[0]):
+            cache.record_hit()
+            return build_response(*entry)
+
+        if entry is not None:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **cache.conditional_headers(entry[0])}
+        response = self._send(method, url, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            cache.record_hit()
+            cache.refresh(key)
+            return build_response(*entry)
+        cache.record_miss()
+        if response.status_code == 200:
+            cache.put(key, response)
+        return response
+
+    def _send(self, method, url, retry_read_timeouts=True, **kwargs):
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        auth = kwargs.get("auth")
+        reauthenticated = False
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.rate_limiter:
+                    self.rate_limiter.record(None)
+                if attempt >= self.max_retries or (not retry_read_timeouts and isinstance(e, requests.ReadTimeout)):
+                    raise
+                time.sleep(self._backoff_seconds(attempt))
+                continue
+
+            # Time of this attempt alone, without rate-limiter waits or earlier retries
+            response.request_seconds = time.monotonic() - started
+            if self.rate_limiter:
+                self.rate_limiter.record(response.status_code, response.request_seconds)
+
+            if response.status_code == 401 and hasattr(auth, "refresh") and not reauthenticated \
+                    and attempt < self.max_retries:
+                # The token expired mid-fetch: log in again and replay this request
+                reauthenticated = True
+                sent_token = response.request.headers.get("Authorization", "").replace("Bearer ", "", 1)
+                try:
+                    refreshed = auth.refresh(sent_token)
+                except Exception:
+                    # A failed re-login leaves the request as unauthorized as it was
+                    refreshed = False
+                if refreshed:
+                    continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                time.sleep(self._backoff_seconds(attempt, response))
+                continue
+
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def parse_retry_after(value):
+    """Turn a Retry-After header (seconds or HTTP date) into seconds, or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide shared client, creating it on first use"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient(rate_limiter=AdaptiveRateLimiter())
+        return _default_client
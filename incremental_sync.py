@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+from datetime import date, timedelta
+
+import pandas as pd
+
+from merge_engine import SALDO_KEY, upsert
+
+SYNC_STATE_FILE = ".sync_state.json"
+
+# Days a date-window sync reaches back past the newest tgl_transaksi (--lookback-days)
+LOOKBACK_DAYS = 3
+
+# Request parameter that filters an endpoint on updated_at, for endpoints that have one.
+# Those sync every row changed since the updated_at watermark; the rest fall back to a
+# tgl_transaksi window and cannot see a row corrected more than LOOKBACK_DAYS after its date.
+UPDATED_SINCE_PARAMS = {}
+
+
+class WatermarkStore:
+    """High-water marks per (endpoint, kdsatker), persisted as one small JSON file"""
+
+    def __init__(self, path=SYNC_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _key(endpoint, kdsatker):
+        return f"{endpoint}|{kdsatker or ''}"
+
+    def get(self, endpoint, kdsatker=None):
+        with self._lock:
+            return self._load().get(self._key(endpoint, kdsatker))
+
+    def set(self, endpoint, kdsatker, watermark):
+        with self._lock:
+            state = self._load()
+            state[self._key(endpoint, kdsatker)] = watermark
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def watermark_of(df):
+    """Latest tgl_transaksi, and updated_at when the frame has it, or None if it has no usable date"""
+    if df is None or df.empty or "tgl_transaksi" not in df.columns:
+        return None
+    newest = pd.to_datetime(df["tgl_transaksi"], errors="coerce", format="mixed").max()
+    if pd.isna(newest):
+        return None
+    watermark = {"tgl_transaksi": newest.date().isoformat()}
+    if "updated_at" in df.columns:
+        updated = pd.to_datetime(df["updated_at"], errors="coerce", format="mixed").max()
+        if not pd.isna(updated):
+            watermark["updated_at"] = updated.isoformat(sep=" ")
+    return watermark
+
+
+def sync_window(watermark, lookback_days=LOOKBACK_DAYS, today=None):
+    """(from_date, to_date) that can still hold new or changed rows, or None for a full pull.
+
+    Balances are usually corrected a day or two after their transaction date,
+    so the window reaches `lookback_days` back past the newest tgl_transaksi.
+    A row corrected later than that lies outside the window and is not
+    fetched again; late_rows() spots when that happens.
+    """
+    if not watermark or not watermark.get("tgl_transaksi"):
+        return None
+    try:
+        newest = date.fromisoformat(watermark["tgl_transaksi"])
+    except (TypeError, ValueError):
+        # A damaged or older state file: fall back to a full pull
+        return None
+    today = today or date.today()
+    return (newest - timedelta(days=lookback_days)).isoformat(), today.isoformat()
+
+
+def sync_params(endpoint, watermark, lookback_days=LOOKBACK_DAYS, today=None):
+    """Request params for the rows that can be new or changed since `watermark`; {} means a full pull"""
+    since = UPDATED_SINCE_PARAMS.get(endpoint)
+    if since and watermark and watermark.get("updated_at"):
+        return {since: watermark["updated_at"]}
+    window = sync_window(watermark, lookback_days, today)
+    return {"from_date": window[0], "to_date": window[1]} if window else {}
+
+
+def late_rows(df, lookback_days=LOOKBACK_DAYS):
+    """How many rows of `df` were updated more than `lookback_days` after their tgl_transaksi.
+
+    Seen among freshly fetched rows, it means corrections arrive later than the
+    date window reaches, so older rows may have changed without being fetched.
+    """
+    if df.empty or "tgl_transaksi" not in df.columns or "updated_at" not in df.columns:
+        return 0
+    day = pd.to_datetime(df["tgl_transaksi"], errors="coerce", format="mixed").dt.normalize()
+    updated = pd.to_datetime(df["updated_at"], errors="coerce", format="mixed").dt.normalize()
+    return int(((updated - day).dt.days > lookback_days).sum())
+
+
+def merge_rows(existing, new, key=SALDO_KEY):
+    """Merge `new` into `existing`, keeping the most recently updated row per key"""
+    return upsert(existing, new, key)[0]
+
+
+def load_dataset(path):
+    """Read an existing local dataset with every column as text, so codes like 024 keep their zeros"""
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def incremental_sync(fetch_rows, endpoint, dataset_path, kdsatker=None, store=None, lookback_days=LOOKBACK_DAYS):
+    """Bring the CSV at `dataset_path` up to date and return (merged_frame, fetched_row_count, late_row_count).
+
+    `fetch_rows(params)` must return the rows for the given extra request params
+    (empty for a full pull, from sync_params() for an incremental one).
+    `late_row_count` is late_rows() of the fetched rows for a date-window
+    sync, and 0 otherwise.
+    """
+    store = store or WatermarkStore()
+    existing = load_dataset(dataset_path)
+
+    watermark = store.get(endpoint, kdsatker) or watermark_of(existing)
+    params = sync_params(endpoint, watermark, lookback_days) if existing is not None else {}
+    new = pd.DataFrame(fetch_rows(params)).fillna("").astype(str)
+    late = late_rows(new, lookback_days) if "from_date" in params else 0
+
+    merged = merge_rows(existing, new)
+    merged.to_csv(dataset_path, index=False)
+
+    new_watermark = watermark_of(merged)
+    if new_watermark:
+        store.set(endpoint, kdsatker, new_watermark)
+    return merged, len(new), late
@@ -0,0 +1,124 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class PageSink:
+    """Write fetched pages straight to disk instead of collecting them in a list.
+
+    Each `write()` turns one page of records into a columnar batch and appends
+    it to the target file: a row group for `.parquet`, a chunk of lines for
+    `.csv`. Memory stays at roughly one page no matter how many pages arrive.
+    The columns are taken from the first non-empty page; a column first seen
+    on a later page widens the file, which rewrites what was written so far
+    once. Values are stored as text so a column that is null on one page and
+    numeric on the next cannot break the file.
+
+    Data goes to `<path>.partial` and is only moved to `path` by a clean
+    `close()`, so a failed fetch never leaves a truncated file behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = "parquet" if path.endswith(".parquet") else "csv"
+        self.rows = 0
+        self.columns = None
+        self._partial_path = f"{path}.partial"
+        self._writer = None
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if os.path.exists(self._partial_path):
+            os.remove(self._partial_path)
+
+    def write(self, records):
+        """Append one page of records (list of dicts)"""
+        if not records:
+            return
+        # object dtype keeps ints as ints when a page also holds nulls (no 1 -> "1.0")
+        batch = pd.DataFrame(records, dtype=object)
+        if self.columns is None:
+            self.columns = list(batch.columns)
+        new_columns = [col for col in batch.columns if col not in self.columns]
+        if new_columns:
+            self._widen(new_columns)
+        self._append(batch)
+        self.rows += len(batch)
+
+    def _append(self, batch):
+        batch = batch.reindex(columns=self.columns).astype("string")
+        if self.format == "parquet":
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if self._writer is None:
+                schema = pa.schema([(col, pa.string()) for col in self.columns])
+                self._writer = pq.ParquetWriter(self._partial_path, schema, compression="snappy")
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            header = not os.path.exists(self._partial_path)
+            batch.to_csv(self._partial_path, mode="a", header=header, index=False)
+
+    def _widen(self, new_columns):
+        """Add columns first seen on a later page, rewriting the rows written so far with them empty"""
+        self.columns = self.columns + new_columns
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if not os.path.exists(self._partial_path):
+            return
+        old_path = f"{self._partial_path}.old"
+        os.replace(self._partial_path, old_path)
+        try:
+            for batch in _iter_file(old_path, self.format):
+                self._append(batch)
+        finally:
+            os.remove(old_path)
+
+    def close(self):
+        """Finish the file and move it into place; returns the final path"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._partial_path):
+            os.replace(self._partial_path, self.path)
+        return self.path
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._partial_path):
+            os.remove(self._partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_ingested(path, columns=None):
+    """Load a file written by PageSink back into a DataFrame"""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False)
+
+
+def _iter_file(path, file_format, batch_rows=100_000):
+    if file_format == "parquet":
+        with pq.ParquetFile(path) as parquet_file:
+            for batch in parquet_file.iter_batches(batch_size=batch_rows):
+                yield batch.to_pandas()
+        return
+    with pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=batch_rows) as reader:
+        yield from reader
+
+
+def iter_ingested(path, batch_rows=100_000):
+    """A file written by PageSink as DataFrames of at most `batch_rows` rows, without loading it whole"""
+    yield from _iter_file(path, "parquet" if path.endswith(".parquet") else "csv", batch_rows)
@@ -0,0 +1,154 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fetch_engine import FetchCancelled
+
+
+class FetchJob:
+    """One background fetch and everything a page needs to show it.
+
+    The target fills `progress` with one new_progress() dict per endpoint or
+    date range and adds messages through `log()`; pages only read from it,
+    so a rerun can pick the job up where it is. `owner` is whoever submitted
+    it, e.g. a Streamlit session id, so each session only sees its own jobs.
+    """
+
+    def __init__(self, name, target, owner=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.target = target
+        self.owner = owner
+        self.status = "queued"
+        self.progress = {}
+        self.messages = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def take_result(self):
+        """Hand the result over once and drop the job's reference to it, so the job no longer holds the data"""
+        result, self.result = self.result, None
+        return result
+
+    def log(self, level, text):
+        """Queue a message for the page; `level` is a Streamlit call name such as "warning" or "error" """
+        self.messages.append((level, text))
+
+    def totals(self):
+        """Pages, known total pages and records summed over all progress dicts"""
+        progress = list(self.progress.values())
+        return {
+            "pages": sum(p["pages"] for p in progress),
+            "total_pages": sum(p["total_pages"] or 0 for p in progress),
+            "records": sum(p["records"] for p in progress),
+        }
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def pages_per_second(self):
+        elapsed = self.elapsed()
+        return self.totals()["pages"] / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self):
+        """Seconds left at the current page rate, or None while the page count is unknown"""
+        totals = self.totals()
+        rate = self.pages_per_second()
+        if self.finished or not totals["total_pages"] or rate <= 0:
+            return None
+        return max(0.0, (totals["total_pages"] - totals["pages"]) / rate)
+
+
+class JobManager:
+    """Run fetch jobs on background threads, `max_workers` at a time, queueing the rest"""
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name, target, owner=None):
+        """Queue `target(job)`; its return value becomes `job.result`"""
+        job = FetchJob(name, target, owner)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job.cancelled:
+            job.status = "cancelled"
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = job.target(job)
+            job.status = "cancelled" if job.cancelled else "done"
+        except FetchCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def jobs(self, owner=None):
+        """Known jobs, newest first; only those of `owner` when given"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if owner is None or job.owner == owner]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job:
+            job.cancel()
+
+    def forget(self, job_id):
+        """Drop a finished job from the list"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.finished:
+                del self._jobs[job_id]
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide job manager; it outlives Streamlit reruns and sessions"""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = JobManager()
+        return _default_manager
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
@@ -0,0 +1,100 @@
+"""Upsert fetched rows into a dataset so it holds one row per natural key.
+
+Rows are matched on a 64-bit hash of their key columns, computed for the
+whole frame at once (pandas' hash_pandas_object), and the winner of each key
+is picked with one lexsort: the row with the latest `updated_at`, or the
+newer fetch when that ties or is missing. Nothing loops over rows in
+Python, so merges stay fast at millions of rows.
+"""
+import numpy as np
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+# Natural key of one saldo row: one balance per account per transaction day
+SALDO_KEY = ["kdsatker", "no_rekening", "tgl_transaksi"]
+
+# Natural keys per endpoint / dataset name; anything else falls back to key_for()'s guess
+MERGE_KEYS = {
+    "saldo_operasional": SALDO_KEY,
+}
+
+ORDER_COLUMN = "updated_at"
+
+
+def key_for(dataset, columns):
+    """The natural key of `dataset`: the configured one, SALDO_KEY for saldo-shaped data, else None (whole row)"""
+    key = MERGE_KEYS.get(dataset)
+    if key and all(col in columns for col in key):
+        return key
+    if all(col in columns for col in SALDO_KEY):
+        return SALDO_KEY
+    return None
+
+
+def row_hashes(df, key=None):
+    """One uint64 per row from the `key` columns (every column when None)"""
+    cols = df[key] if key else df
+    # The same instant stored at different resolutions must hash the same
+    naive_datetimes = [col for col in cols.columns if cols[col].dtype.kind == "M"]
+    if naive_datetimes:
+        cols = cols.astype({col: "datetime64[ns]" for col in naive_datetimes})
+    return hash_pandas_object(cols, index=False).to_numpy()
+
+
+def _order_values(values):
+    """`updated_at` as sortable int64 nanoseconds, with missing values sorting first"""
+    if values.dtype.kind != "M":
+        values = pd.to_datetime(values, errors="coerce", format="mixed")
+    values = values.astype("datetime64[ns]")
+    return np.where(values.isna(), np.iinfo(np.int64).min, values.to_numpy().view("int64"))
+
+
+def upsert(existing, new, key=None, order_by=ORDER_COLUMN):
+    """Merge `new` into `existing`, keeping one row per `key`; returns (merged, stats).
+
+    `key` defaults to all columns (exact duplicates only). Per key the row
+    with the latest `order_by` wins; on a tie the row from `new` wins. Rows
+    keep their original order. `stats` counts inserted (new keys), updated
+    (existing keys replaced by a different row from `new`) and unchanged rows
+    of `new` (identical to the row already there, or older than it).
+    """
+    if existing is None or existing.empty:
+        existing = new.iloc[:0]
+    combined = pd.concat([existing, new], ignore_index=True)
+    if combined.empty:
+        return combined, {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    key = [col for col in key if col in combined.columns] if key else None
+    hashes = row_hashes(combined, key or None)
+    from_new = np.arange(len(combined)) >= len(existing)
+
+    if order_by in combined.columns:
+        # lexsort is stable and sorts by the last key first: hash, then updated_at, then position
+        order = np.lexsort((_order_values(combined[order_by]), hashes))
+    else:
+        order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+    last_of_key = np.r_[sorted_hashes[1:] != sorted_hashes[:-1], True]
+    keep = np.sort(order[last_of_key])
+
+    new_hashes = np.unique(hashes[from_new])
+    kept_new = keep[from_new[keep]]
+    known = np.isin(hashes[kept_new], hashes[~from_new])
+    if key:
+        # A re-fetched row that equals the stored one in every column changed nothing
+        full_hashes = row_hashes(combined)
+        same = known & np.isin(full_hashes[kept_new], full_hashes[~from_new])
+    else:
+        same = known
+    stats = {
+        "inserted": int((~known).sum()),
+        "updated": int((known & ~same).sum()),
+        "unchanged": int(len(new_hashes) - len(kept_new) + same.sum()),
+    }
+    merged = combined.iloc[keep].reset_index(drop=True)
+    # concat turns categoricals with different categories into objects; bring them back
+    categorical = [col for col in merged.columns
+                   if any(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in (existing, new) if col in frame)]
+    if categorical:
+        merged = merged.astype({col: "category" for col in categorical})
+    return merged, stats
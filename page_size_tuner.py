@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+
+PAGE_SIZE_FILE = ".page_sizes.json"
+
+_store_lock = threading.Lock()
+
+
+def _load_sizes(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+class PageSizeTuner:
+    """Pick the `length` of DataTables-style pages while a fetch runs.
+
+    The size doubles while pages come back well under `target_seconds` and
+    `max_bytes`, halves when a page is slower or bigger than that, and halves
+    on a read timeout so the same offset can be retried with a smaller page.
+    The last good size is remembered per endpoint in PAGE_SIZE_FILE and used
+    as the starting point of the next run. Safe to share between the worker
+    threads of one fetch, e.g. parallel date windows.
+    """
+
+    def __init__(self, endpoint, initial=1000, min_size=100, max_size=20000,
+                 target_seconds=10.0, max_bytes=16 * 1024 * 1024, path=PAGE_SIZE_FILE):
+        self.endpoint = endpoint
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.path = path
+        self._lock = threading.Lock()
+        remembered = _load_sizes(path).get(endpoint)
+        self.size = self._clamp(remembered or initial)
+
+    def _clamp(self, size):
+        return int(min(self.max_size, max(self.min_size, size)))
+
+    def record(self, seconds, nbytes, size=None):
+        """Adjust the size after a page of `size` rows (default: the current size) came back"""
+        with self._lock:
+            # Measured against the size that was asked for, so parallel pages do not compound
+            size = size or self.size
+            if seconds > self.target_seconds or nbytes > self.max_bytes:
+                self.size = self._clamp(min(self.size, size // 2))
+            elif seconds < self.target_seconds / 2 and nbytes < self.max_bytes / 2:
+                self.size = self._clamp(max(self.size, size * 2))
+
+    def on_timeout(self, size=None):
+        """Shrink after a timeout of a page of `size` rows; returns False once the size cannot shrink any further"""
+        with self._lock:
+            size = size or self.size
+            if size <= self.min_size:
+                return False
+            self.size = self._clamp(min(self.size, size // 2))
+            return True
+
+    def cap(self, served):
+        """The server returned fewer rows than asked although more exist: never ask for more than it serves"""
+        with self._lock:
+            self.max_size = max(self.min_size, served)
+            self.size = self._clamp(self.size)
+
+    def save(self):
+        with _store_lock:
+            sizes = _load_sizes(self.path)
+            sizes[self.endpoint] = self.size
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(sizes, f, indent=2)
+            os.replace(tmp_path, self.path)
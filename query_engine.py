@@ -0,0 +1,193 @@
+"""DuckDB over the fetched datasets, so charts get aggregates instead of whole frames.
+
+Tables are either DataFrames registered in place (no copy) or views over the
+Parquet files of the dataset store, which DuckDB scans lazily: only the
+columns a query uses are read, and datasets larger than memory still work.
+The helpers return small, already aggregated DataFrames ready for Plotly,
+including histogram bins and box-plot statistics, so figures never carry
+the raw rows.
+"""
+import threading
+
+import duckdb
+import pandas as pd
+
+from dataset_store import DatasetStore
+
+# Above this many rows, profile() estimates distinct counts instead of counting them exactly
+APPROX_DISTINCT_ROWS = 100_000
+
+
+def quote_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def where_clause(filters, search=None):
+    """SQL and parameters for {column: [allowed values]} and {column: text it must contain}; values are compared as text"""
+    conditions = []
+    params = []
+    for column, values in (filters or {}).items():
+        if not values:
+            continue
+        conditions.append(f"CAST({quote_ident(column)} AS VARCHAR) IN ({', '.join('?' for _ in values)})")
+        params += [str(value) for value in values]
+    for column, text in (search or {}).items():
+        if text:
+            conditions.append(f"CAST({quote_ident(column)} AS VARCHAR) ILIKE ?")
+            params.append(f"%{text}%")
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def file_source(path):
+    """A DuckDB table function reading a CSV or Parquet file"""
+    if path.endswith(".parquet"):
+        return f"read_parquet({sql_string(path)})"
+    # Every field as text, so codes such as 024 keep their leading zeros
+    return f"read_csv({sql_string(path)}, all_varchar = true, header = true)"
+
+
+class QueryEngine:
+    """One in-process DuckDB connection with the datasets registered as tables"""
+
+    def __init__(self, store=None):
+        self.store = store or DatasetStore()
+        self._con = duckdb.connect()
+        self._lock = threading.Lock()
+
+    def register_frame(self, name, df):
+        """Expose a DataFrame as table `name` without copying it"""
+        with self._lock:
+            self._con.register(name, df)
+
+    def register_dataset(self, dataset, months=None, name=None):
+        """Expose the Parquet files of a stored dataset (optionally only some months) as view `name`.
+
+        The month=YYYY-MM folders are not read as a column: the rows carry their own tgl_transaksi.
+        """
+        paths = self.store.files(dataset, months)
+        if not paths:
+            raise ValueError(f"No stored data for {dataset}")
+        files = "[" + ", ".join(sql_string(path) for path in paths) + "]"
+        with self._lock:
+            self._con.execute(f"CREATE OR REPLACE VIEW {quote_ident(name or dataset)} AS "
+                              f"SELECT * FROM read_parquet({files}, union_by_name = true, hive_partitioning = false)")
+
+    def register_file(self, name, path):
+        """Expose a CSV or Parquet file (e.g. one written by PageSink) as view `name`, read on demand"""
+        with self._lock:
+            self._con.execute(f"CREATE OR REPLACE VIEW {quote_ident(name)} AS SELECT * FROM {file_source(path)}")
+
+    def query(self, sql, params=None):
+        """Run `sql` and return the result as a DataFrame"""
+        with self._lock:
+            return self._con.execute(sql, params or []).df()
+
+    def columns(self, table):
+        """{column: DuckDB type} of a registered table"""
+        rows = self.query(f"DESCRIBE {quote_ident(table)}")
+        return dict(zip(rows["column_name"], rows["column_type"]))
+
+    def count(self, table, filters=None, search=None):
+        where, params = where_clause(filters, search)
+        return int(self.query(f"SELECT count(*) AS n FROM {quote_ident(table)}{where}", params)["n"][0])
+
+    def page(self, table, offset=0, limit=50, sort=None, descending=False, filters=None, search=None):
+        """One window of rows, optionally sorted by `sort`; only these rows leave DuckDB"""
+        where, params = where_clause(filters, search)
+        order = f" ORDER BY {quote_ident(sort)} {'DESC' if descending else 'ASC'} NULLS LAST" if sort else ""
+        return self.query(f"SELECT * FROM {quote_ident(table)}{where}{order} "
+                          f"LIMIT {int(limit)} OFFSET {int(offset)}", params)
+
+    def profile(self, table, exact_below=APPROX_DISTINCT_ROWS):
+        """Per column: type, non-null and null counts and distinct values, in one scan.
+
+        Distinct values are exact for tables under `exact_below` rows and a
+        HyperLogLog estimate (approx_count_distinct) above that.
+        """
+        types = self.columns(table)
+        if not types:
+            return pd.DataFrame(columns=["Column", "Type", "Non-Null Count", "Null Count", "Unique Values"])
+        rows = self.count(table)
+        distinct = "count(DISTINCT {})" if rows < exact_below else "approx_count_distinct({})"
+        selects = []
+        for column in types:
+            column = quote_ident(column)
+            selects += [f"count({column})", distinct.format(column)]
+        values = self.query(f"SELECT {', '.join(selects)} FROM {quote_ident(table)}").iloc[0].tolist()
+        return pd.DataFrame({
+            "Column": list(types),
+            "Type": list(types.values()),
+            "Non-Null Count": values[0::2],
+            "Null Count": [rows - count for count in values[0::2]],
+            "Unique Values": values[1::2],
+        })
+
+    def top_n(self, table, column, n=10, filters=None):
+        """The `n` rows with the highest `column`"""
+        where, params = where_clause(filters)
+        return self.query(f"SELECT * FROM {quote_ident(table)}{where} "
+                          f"ORDER BY {quote_ident(column)} DESC NULLS LAST LIMIT {int(n)}", params)
+
+    def group_summary(self, table, by, value, filters=None):
+        """Count, sum and mean of `value` per `by`"""
+        where, params = where_clause(filters)
+        by, value = quote_ident(by), quote_ident(value)
+        return self.query(f"SELECT {by}, count({value}) AS \"Count\", sum({value}) AS \"Total\", "
+                          f"avg({value}) AS \"Average\" FROM {quote_ident(table)}{where} "
+                          f"GROUP BY {by} ORDER BY \"Count\" DESC", params)
+
+    def value_counts(self, table, column, n=15, filters=None):
+        """The `n` most frequent values of `column` with their counts"""
+        where, params = where_clause(filters)
+        column = quote_ident(column)
+        return self.query(f"SELECT {column} AS value, count(*) AS count FROM {quote_ident(table)}{where} "
+                          f"GROUP BY {column} ORDER BY count DESC, value LIMIT {int(n)}", params)
+
+    def counts_by_date(self, table, column, filters=None):
+        """Rows per calendar day of `column`, skipping values that are not dates"""
+        where, params = where_clause(filters)
+        day = f"TRY_CAST({quote_ident(column)} AS DATE)"
+        extra = f"{' AND' if where else ' WHERE'} {day} IS NOT NULL"
+        return self.query(f"SELECT {day} AS date, count(*) AS count FROM {quote_ident(table)}{where}{extra} "
+                          f"GROUP BY 1 ORDER BY 1", params)
+
+    def entity_days(self, table, entity, column):
+        """Distinct (`entity`, day of `column`) pairs, the input of a CoverageMatrix, skipping values that are not dates"""
+        day = f"TRY_CAST({quote_ident(column)} AS DATE)"
+        return self.query(f"SELECT DISTINCT {quote_ident(entity)}, {day} AS {quote_ident(column)} "
+                          f"FROM {quote_ident(table)} WHERE {day} IS NOT NULL")
+
+    def _numeric(self, table, column, filters):
+        """A CTE `v(x)` with the non-null values of `column` as DOUBLE, and its parameters"""
+        where, params = where_clause(filters)
+        column = quote_ident(column)
+        extra = f"{' AND' if where else ' WHERE'} {column} IS NOT NULL"
+        return f"WITH v AS (SELECT CAST({column} AS DOUBLE) AS x FROM {quote_ident(table)}{where}{extra})", params
+
+    def histogram(self, table, column, bins=30, filters=None):
+        """`bins` equal-width bins of `column` with their start, end and count; empty bins are left out"""
+        values, params = self._numeric(table, column, filters)
+        bins = int(bins)
+        return self.query(f"""{values},
+            r AS (SELECT min(x) AS lo, greatest(max(x) - min(x), 1e-9) / {bins} AS width FROM v),
+            b AS (SELECT least(floor((x - lo) / width), {bins - 1}) AS bin FROM v, r)
+            SELECT lo + bin * width AS start, lo + (bin + 1) * width AS "end", count(*) AS count
+            FROM b, r GROUP BY bin, lo, width ORDER BY bin""", params)
+
+    def box_stats(self, table, column, filters=None):
+        """Quartiles, mean, Tukey fences (1.5 IQR) and the number of values outside them, as one dict"""
+        values, params = self._numeric(table, column, filters)
+        stats = self.query(f"""{values},
+            q AS (SELECT quantile_cont(x, 0.25) AS q1, median(x) AS median, quantile_cont(x, 0.75) AS q3,
+                         avg(x) AS mean, count(*) AS n FROM v),
+            f AS (SELECT *, q1 - 1.5 * (q3 - q1) AS lo, q3 + 1.5 * (q3 - q1) AS hi FROM q)
+            SELECT any_value(q1) AS q1, any_value(median) AS median, any_value(q3) AS q3,
+                   any_value(mean) AS mean, any_value(n) AS n,
+                   min(x) FILTER (WHERE x >= lo) AS lowerfence, max(x) FILTER (WHERE x <= hi) AS upperfence,
+                   count(*) FILTER (WHERE x < lo OR x > hi) AS outliers
+            FROM v, f""", params)
+        return stats.iloc[0].to_dict()
@@ -0,0 +1,63 @@
+import threading
+import time
+
+# Responses that mean the server wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by every worker, with an AIMD-adjusted refill rate.
+
+    Each successful, fast response raises the rate by `increase` requests/sec;
+    a throttling response, a connection failure or a response slower than
+    `latency_target` multiplies it by `decrease`. The rate always stays within
+    [min_rate, max_rate].
+    """
+
+    def __init__(self, rate=5.0, min_rate=0.2, max_rate=50.0, increase=0.2, decrease=0.5, latency_target=10.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.throttled = 0
+
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        # Capacity of about one second's worth of requests allows a small burst
+        capacity = max(1.0, self.rate)
+        self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def record(self, status_code=None, latency=None):
+        """Feed back one outcome; `status_code` None means the request failed outright"""
+        with self._lock:
+            self._refill()
+            if status_code is None or status_code in THROTTLE_STATUSES:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            elif latency is not None and latency > self.latency_target:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            elif status_code < 400:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def set_max_rate(self, max_rate):
+        with self._lock:
+            self.max_rate = max(max_rate, self.min_rate)
+            self.rate = min(self.rate, self.max_rate)
@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+CACHE_DIR = ".http_cache"
+
+# JWT claims that change on every login and say nothing about who is asking
+_VOLATILE_CLAIMS = {"iat", "exp", "nbf", "jti"}
+
+
+def _identity(headers):
+    """Who a request is made as: the stable JWT claims of its bearer token, or the raw header"""
+    auth = (headers or {}).get("Authorization", "")
+    token = auth[7:] if auth.startswith("Bearer ") else auth
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        claims = None
+    if isinstance(claims, dict):
+        return {k: v for k, v in claims.items() if k not in _VOLATILE_CLAIMS}
+    return hashlib.sha1(auth.encode("utf-8")).hexdigest() if auth else None
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return None if value is None else str(value).strip()
+
+
+def _write_json(path, value):
+    # Write then rename, so a reader never sees a half-written file
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class ResponseCache:
+    """Opt-in on-disk cache of successful responses.
+
+    Entries are keyed by method, URL, normalized params/form/JSON body and the
+    caller's identity, so a page number in either the query string or the form
+    data is part of the key. Fresh entries (younger than `ttl_seconds`) are
+    served without touching the network; stale ones carrying an ETag or
+    Last-Modified are revalidated with a conditional request. Once the cache
+    grows past `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, root=CACHE_DIR, ttl_seconds=3600, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._size = sum(
+            os.path.getsize(os.path.join(root, name)) for name in os.listdir(root) if name.endswith(".body")
+        )
+
+    def key(self, method, url, params=None, data=None, json_body=None, headers=None):
+        payload = json.dumps({
+            "method": method.upper(),
+            "url": url,
+            "params": _normalize(params),
+            "data": _normalize(data),
+            "json": _normalize(json_body),
+            "identity": _identity(headers),
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        return os.path.join(self.root, f"{key}.json"), os.path.join(self.root, f"{key}.body")
+
+    def get(self, key):
+        """(meta, body) for a stored entry, or None"""
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        # The body's mtime doubles as the LRU clock
+        os.utime(body_path)
+        return meta, body
+
+    def record_hit(self):
+        with self._stats_lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._stats_lock:
+            self.misses += 1
+
+    def is_fresh(self, meta):
+        return time.time() - meta["stored_at"] < self.ttl_seconds
+
+    def put(self, key, response):
+        meta_path, body_path = self._paths(key)
+        meta = {
+            "stored_at": time.time(),
+            "status_code": response.status_code,
+            "url": response.url,
+            "headers": {
+                name: response.headers[name]
+                for name in ("Content-Type", "ETag", "Last-Modified") if name in response.headers
+            },
+        }
+        with self._lock:
+            old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            with open(f"{body_path}.tmp", "wb") as f:
+                f.write(response.content)
+            os.replace(f"{body_path}.tmp", body_path)
+            _write_json(meta_path, meta)
+            self._size += len(response.content) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def refresh(self, key):
+        """Mark an entry fresh again after the server answered 304 Not Modified"""
+        meta_path, _ = self._paths(key)
+        entry = self.get(key)
+        if entry is None:
+            return
+        meta, _ = entry
+        meta["stored_at"] = time.time()
+        with self._lock:
+            _write_json(meta_path, meta)
+
+    def _evict(self):
+        bodies = []
+        for name in os.listdir(self.root):
+            if name.endswith(".body"):
+                path = os.path.join(self.root, name)
+                stat = os.stat(path)
+                bodies.append((stat.st_mtime, stat.st_size, name[:-5]))
+        # Drop least recently used entries until we are comfortably under the limit
+        for _, size, key in sorted(bodies):
+            if self._size <= self.max_bytes * 0.9:
+                break
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._size -= size
+
+    def conditional_headers(self, meta):
+        headers = {}
+        if "ETag" in meta["headers"]:
+            headers["If-None-Match"] = meta["headers"]["ETag"]
+        if "Last-Modified" in meta["headers"]:
+            headers["If-Modified-Since"] = meta["headers"]["Last-Modified"]
+        return headers
+
+
+def build_response(meta, body):
+    """Turn a stored entry back into a requests.Response"""
+    response = requests.Response()
+    response.status_code = meta["status_code"]
+    response.url = meta["url"]
+    response.headers.update(meta["headers"])
+    response._content = body
+    return response
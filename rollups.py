@@ -0,0 +1,81 @@
+"""Pre-aggregated saldo_akhir rollups per kdbank, per kdsatker and per day.
+
+They are built when data is ingested (a fetch lands in the session, or a
+month is written to the dataset store) and are tiny next to the rows they
+summarise: one row per group with the number of rows and the count, sum,
+min and max of saldo_akhir. The Visualize charts read them, so drawing a
+chart costs the number of banks, satkers or days, not the number of rows.
+Rollups of different slices (months, pages) are merged with combine().
+"""
+import pandas as pd
+
+VALUE_COLUMN = "saldo_akhir"
+DAY_COLUMN = "tgl_transaksi"
+
+# Rollup name -> the columns it groups by; "day" is tgl_transaksi truncated to the day
+ROLLUPS = {
+    "kdbank": ["kdbank"],
+    # nmsatker rides along so charts can label satkers by name
+    "kdsatker": ["kdsatker", "nmsatker"],
+    "day": ["day"],
+}
+STATS = ["rows", "count", "total", "min", "max"]
+
+
+def _groups(df, name):
+    """The group columns of rollup `name` for `df`, or None when `df` lacks them"""
+    if name == "day":
+        if DAY_COLUMN not in df.columns:
+            return None
+        day = df[DAY_COLUMN]
+        if day.dtype.kind != "M":
+            day = pd.to_datetime(day, errors="coerce", format="mixed")
+        return pd.DataFrame({"day": day.dt.floor("D")}, index=df.index)
+    columns = [col for col in ROLLUPS[name] if col in df.columns]
+    if ROLLUPS[name][0] not in columns:
+        return None
+    return df[columns]
+
+
+def build_rollups(df, value=VALUE_COLUMN):
+    """{rollup name: DataFrame of group columns + rows, count, total, min, max} for the rollups `df` can feed"""
+    rollups = {}
+    values = df[value] if value in df.columns else pd.Series(pd.NA, index=df.index, dtype="Float64")
+    for name in ROLLUPS:
+        groups = _groups(df, name)
+        if groups is None:
+            continue
+        frame = groups.assign(**{VALUE_COLUMN: values})
+        keys = list(groups.columns)
+        # Rows without a day have no place on a timeline; missing codes are still a group
+        grouped = frame.groupby(keys, dropna=name == "day", observed=True, sort=True)[VALUE_COLUMN]
+        rollups[name] = grouped.agg(rows="size", count="count", total="sum", min="min", max="max").reset_index()
+    return rollups
+
+
+def combine(frames):
+    """Merge rollups of the same kind built from different slices of data into one"""
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    frame = pd.concat(frames, ignore_index=True)
+    keys = [col for col in frame.columns if col not in STATS]
+    grouped = frame.groupby(keys, dropna=False, observed=True, sort=True)
+    return grouped.agg(rows=("rows", "sum"), count=("count", "sum"), total=("total", "sum"),
+                       min=("min", "min"), max=("max", "max")).reset_index()
+
+
+def combine_all(rollup_sets):
+    """combine() applied per rollup name across several build_rollups() results"""
+    names = {name for rollups in rollup_sets for name in rollups}
+    merged = {name: combine([rollups.get(name) for rollups in rollup_sets]) for name in names}
+    return {name: frame for name, frame in merged.items() if frame is not None}
+
+
+def top_groups(rollup, column, n=15):
+    """The `n` most frequent values of one group column of a rollup, as (value, count) like QueryEngine.value_counts"""
+    counts = rollup.groupby(column, dropna=False, observed=True)["rows"].sum()
+    counts = counts.sort_values(ascending=False, kind="stable").head(n)
+    return pd.DataFrame({"value": counts.index.astype(object), "count": counts.to_numpy()})
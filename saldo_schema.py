@@ -0,0 +1,62 @@
+"""Compact column types for BIOS saldo rows, applied when data is ingested.
+
+Everything arrives as text. Left that way every value is a Python string
+object, although kddept, kdsatker, nmsatker, unit and kdbank repeat the same
+few values on every row. apply_schema() turns those into categoricals (of
+strings, so codes like 024 and 008 keep their leading zeros), saldo_akhir
+into an exact Int64 (or a decimal if the data has fractions) and the date
+columns into datetimes. Columns the schema does not know are left alone.
+"""
+import pandas as pd
+import pyarrow as pa
+
+CATEGORY_COLUMNS = ["kddept", "kdsatker", "nmsatker", "unit", "kdbank"]
+AMOUNT_COLUMNS = ["saldo_akhir"]
+INTEGER_COLUMNS = ["rn"]
+DATETIME_COLUMNS = ["tgl_transaksi", "updated_at"]
+
+
+def _text(values):
+    text = values.astype("string").str.strip()
+    return text.mask(text == "")
+
+
+def to_amount(values):
+    """Exact amounts: Int64 when every value is whole, otherwise a decimal with the places the data uses"""
+    if pd.api.types.is_integer_dtype(values):
+        return values.astype("Int64")
+    if pd.api.types.is_float_dtype(values):
+        whole = values.dropna()
+        return values.astype("Int64") if (whole == whole.round()).all() else values
+    text = _text(values)
+    arr = pa.array(text.to_numpy(dtype=object, na_value=None), type=pa.string())
+    try:
+        amounts = arr.cast(pa.int64()).to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+        return amounts.set_axis(values.index).rename(values.name)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        pass
+    places = text.str.extract(r"\.(\d+)$")[0].str.len().max()
+    try:
+        decimals = arr.cast(pa.decimal128(38, int(places) if pd.notna(places) else 0))
+        return decimals.to_pandas(types_mapper=pd.ArrowDtype).set_axis(values.index).rename(values.name)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # Not plain numbers after all; better approximate than lost
+        return pd.to_numeric(text, errors="coerce")
+
+
+def apply_schema(df):
+    """A copy of `df` with the saldo columns it has converted to their compact types"""
+    df = df.copy()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = _text(df[col]).astype("category")
+    for col in AMOUNT_COLUMNS:
+        if col in df.columns:
+            df[col] = to_amount(df[col])
+    for col in INTEGER_COLUMNS:
+        if col in df.columns and not pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(_text(df[col]), errors="coerce").astype("Int64")
+    for col in DATETIME_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(_text(df[col]), errors="coerce", format="mixed")
+    return df
@@ -0,0 +1,72 @@
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
+from rate_limiter import AdaptiveRateLimiter
+
+
+class FetchScheduler:
+    """Fetch many endpoints at once under a shared request budget.
+
+    `max_endpoints` is how many endpoints are worked on at the same time,
+    `max_requests` caps the HTTP requests in flight across all of them and
+    `per_host` caps the requests in flight to any single host. `max_rate`
+    caps the requests per second of this scheduler only, on top of the
+    process-wide adaptive limiter that every fetch shares.
+    """
+
+    def __init__(self, max_endpoints=4, max_requests=8, per_host=4, max_rate=None):
+        self.max_endpoints = max_endpoints
+        self.per_host = per_host
+        # A token bucket that never adapts: min and max rate are the same
+        self._rate_cap = AdaptiveRateLimiter(max_rate, max_rate, max_rate) if max_rate else None
+        self._global_slots = threading.BoundedSemaphore(max_requests)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    @contextmanager
+    def request_slot(self, url):
+        """Hold a global and a per-host slot for the duration of one request"""
+        # Always host first, then global, so waiters can never deadlock each other
+        with self._host_slot(url):
+            with self._global_slots:
+                if self._rate_cap:
+                    self._rate_cap.acquire()
+                yield
+
+    def run(self, endpoints, fetch_fn, on_tick=None, tick_seconds=0.5):
+        """Run `fetch_fn(endpoint)` for every endpoint, yielding (endpoint, result, error) as each finishes.
+
+        `on_tick` is called from the calling thread about every `tick_seconds`
+        while work is pending, so Streamlit pages can refresh their progress widgets.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_endpoints) as executor:
+            pending = {executor.submit(fetch_fn, endpoint): endpoint for endpoint in endpoints}
+            while pending:
+                done, _ = wait(pending, timeout=tick_seconds, return_when=FIRST_COMPLETED)
+                for future in done:
+                    endpoint = pending.pop(future)
+                    error = future.exception()
+                    yield endpoint, None if error else future.result(), error
+                if on_tick:
+                    on_tick()
+
+
+def read_satkers(value):
+    """Satker codes from a comma-separated list or from a file with one code per line"""
+    if os.path.isfile(value):
+        with open(value, encoding="utf-8") as f:
+            codes = [line.strip() for line in f]
+    else:
+        codes = [code.strip() for code in value.split(",")]
+    # Keep the first occurrence of each code, in order
+    return list(dict.fromkeys(code for code in codes if code))
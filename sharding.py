@@ -0,0 +1,138 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, timedelta
+
+SHARD_UNITS = ["day", "week", "month"]
+
+
+def parse_date(value):
+    """Accept a date, or a YYYY-MM-DD / YYYY/MM/DD string"""
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value.strip().replace("/", "-"), "%Y-%m-%d").date()
+
+
+def split_range(from_date, to_date, unit="month"):
+    """Split an inclusive date range into consecutive (start, end) windows of one day, week or month"""
+    start, end = parse_date(from_date), parse_date(to_date)
+    windows = []
+    while start <= end:
+        if unit == "day":
+            window_end = start
+        elif unit == "week":
+            window_end = start + timedelta(days=6 - start.weekday())
+        elif unit == "month":
+            next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+            window_end = next_month - timedelta(days=1)
+        else:
+            raise ValueError(f"Unknown shard unit: {unit}")
+        window_end = min(window_end, end)
+        windows.append((start, window_end))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def halve(window):
+    start, end = window
+    middle = start + timedelta(days=(end - start).days // 2)
+    return [(start, middle), (middle + timedelta(days=1), end)]
+
+
+def _row_key(row, key):
+    if key:
+        return tuple(row.get(col) for col in key)
+    return hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode("utf-8")).digest()
+
+
+def _touches(window, other):
+    """Whether two windows overlap or sit next to each other, so a boundary row could be in both"""
+    return other[0] <= window[1] + timedelta(days=1) and other[1] >= window[0] - timedelta(days=1)
+
+
+def fetch_sharded(from_date, to_date, fetch_window, emit, unit="month", max_workers=4,
+                  probe_window=None, dense_threshold=5000, key=None, on_tick=None, tick_seconds=0.5):
+    """Fetch a date range as parallel windows, each with its own shallow pagination.
+
+    `fetch_window(start, end, probe, emit_page)` fetches one window and passes
+    every page of rows to `emit_page` as it arrives, so no window is held in
+    memory. When `probe_window(start, end)` is given it must return
+    (row_count, probe) cheaply, e.g. the total and the first page of the
+    window; windows above `dense_threshold` rows are halved until they fit or
+    cover a single day, and the probe of a window that is kept is handed to
+    `fetch_window` so the page is not requested twice. Without
+    `probe_window` the probe is None.
+
+    Rows are de-duplicated on `key` (a list of column names, or the whole row
+    when None) and handed to `emit(rows)` one page at a time, under a lock, so
+    `emit` never runs in two threads at once. Only rows on a shared boundary
+    can repeat, so a page is compared with the windows next to its own, and a
+    window's keys are dropped once it and both of its neighbours have
+    finished. Rows of a window that fails part-way have already been
+    emitted. Returns (rows_emitted, failed), where failed is a list of
+    ((start, end), error) pairs.
+    """
+    range_start, range_end = parse_date(from_date), parse_date(to_date)
+    seen = {}  # window -> keys of its rows, while it or a neighbour may still need them
+    finished = []
+    emitted = 0
+    failed = []
+    lock = threading.Lock()
+
+    def window_emitter(window):
+        with lock:
+            window_keys = seen[window] = set()
+
+        def emit_page(rows):
+            nonlocal emitted
+            with lock:
+                neighbours = [keys for other, keys in seen.items() if other != window and _touches(window, other)]
+                fresh = []
+                for row in rows:
+                    row_key = _row_key(row, key)
+                    if row_key not in window_keys and not any(row_key in keys for keys in neighbours):
+                        window_keys.add(row_key)
+                        fresh.append(row)
+                if fresh:
+                    emit(fresh)
+                    emitted += len(fresh)
+        return emit_page
+
+    def run_window(window):
+        start, end = window
+        probe = None
+        if probe_window:
+            rows, probe = probe_window(start, end)
+            if start < end and rows > dense_threshold:
+                return halve(window)
+        fetch_window(start, end, probe, window_emitter(window))
+        return None
+
+    def covered(day):
+        return not range_start <= day <= range_end or any(start <= day <= end for start, end in finished)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(run_window, w): w for w in split_range(from_date, to_date, unit)}
+        while pending:
+            done, _ = wait(pending, timeout=tick_seconds, return_when=FIRST_COMPLETED)
+            for future in done:
+                window = pending.pop(future)
+                error = future.exception()
+                if error is None and future.result():
+                    for half in future.result():
+                        pending[executor.submit(run_window, half)] = half
+                    continue
+                if error is not None:
+                    failed.append((window, error))
+
+                # A failed window sends no more rows either, so it counts as finished for the bookkeeping
+                finished.append(window)
+                with lock:
+                    for other in [w for w in seen if w in finished and _touches(window, w)]:
+                        if covered(other[0] - timedelta(days=1)) and covered(other[1] + timedelta(days=1)):
+                            del seen[other]
+            if on_tick:
+                on_tick()
+
+    return emitted, failed
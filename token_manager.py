@@ -0,0 +1,124 @@
+import base64
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from requests.auth import AuthBase
+
+from http_client import get_client
+
+# Refresh this many seconds before the token's `exp`, so no request goes out with a dying token
+REFRESH_MARGIN = 300
+
+
+class AuthError(Exception):
+    """Logging in again with the stored credentials failed"""
+
+
+def jwt_claims(token):
+    """Decode a JWT's payload without verifying it (we only need `exp` and friends)"""
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (AttributeError, IndexError, ValueError):
+        return {}
+
+
+def extract_token(data):
+    """Pull the token out of a login response: 'token', 'access_token' or 'data.token'"""
+    if not isinstance(data, dict):
+        return None
+    nested = data.get("data") if isinstance(data.get("data"), dict) else {}
+    return data.get("token") or data.get("access_token") or nested.get("token")
+
+
+def auth_url_for(url):
+    """The /api2/authenticate URL on the same host as `url`"""
+    parts = urlparse(url)
+    return f"{parts.scheme}://{parts.netloc}/api2/authenticate"
+
+
+class TokenManager(AuthBase):
+    """Bearer auth for BIOS that keeps the JWT valid through long fetches.
+
+    Used as `auth=` on HttpClient requests. Before a request goes out the
+    token is refreshed through the login flow if its `exp` is within
+    REFRESH_MARGIN seconds, and HttpClient calls `refresh()` and retries once
+    when a request still comes back 401. When that login fails the current
+    token is kept, so the request ends as the 401 it would have been. Without
+    credentials the token is used as is, the way a hard-coded token always was.
+    """
+
+    def __init__(self, token=None, auth_url=None, username=None, password=None, refresh_margin=REFRESH_MARGIN):
+        self._token = token
+        self.auth_url = auth_url
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, api_url, default_token=None):
+        """Build from BIOS_TOKEN / BIOS_USERNAME / BIOS_PASSWORD / BIOS_AUTH_URL, for the CLI scripts"""
+        return cls(
+            token=os.environ.get("BIOS_TOKEN") or default_token,
+            auth_url=os.environ.get("BIOS_AUTH_URL") or auth_url_for(api_url),
+            username=os.environ.get("BIOS_USERNAME"),
+            password=os.environ.get("BIOS_PASSWORD"),
+        )
+
+    @property
+    def can_refresh(self):
+        return bool(self.auth_url and self.username and self.password)
+
+    @property
+    def expires_at(self):
+        """Unix time the current token expires, or None if it does not say"""
+        exp = jwt_claims(self._token).get("exp")
+        return float(exp) if exp else None
+
+    @property
+    def token(self):
+        """A token that is valid for at least `refresh_margin` more seconds, when we can arrange that"""
+        expires_at = self.expires_at
+        if self.can_refresh and (self._token is None or (expires_at and expires_at - time.time() < self.refresh_margin)):
+            try:
+                self.refresh(self._token)
+            except AuthError:
+                # It may still be good for a while; if not, the server's 401 says so
+                pass
+        return self._token
+
+    def login(self):
+        """Authenticate with the stored credentials and return the new token"""
+        response = get_client().post(self.auth_url, json={"username": self.username, "password": self.password})
+        response.raise_for_status()
+        token = extract_token(response.json())
+        if not token:
+            raise RuntimeError("Login succeeded but the response holds no token")
+        return token
+
+    def refresh(self, stale_token=None):
+        """Log in again unless another thread already replaced `stale_token`. Returns True if a token is available."""
+        if not self.can_refresh:
+            return False
+        with self._lock:
+            if stale_token is not None and self._token != stale_token:
+                return True
+            try:
+                self._token = self.login()
+            except Exception as e:
+                raise AuthError(f"Login to {self.auth_url} failed: {e}") from e
+            self.refreshes += 1
+            return True
+
+    def authorization(self):
+        token = self.token
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
+    def __call__(self, request):
+        request.headers.update(self.authorization())
+        return request